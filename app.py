@@ -9,11 +9,11 @@ from frontend.pages import (
     kursplan_page
 )
 from frontend.navigation import create_sidebar
-import requests
+from backend.http_utils import prewarm_connections
+from backend.vision_utils import request_image_url
+from backend.telemetry import start_metrics_server
+from backend.session_utils import SESSION_COOKIE, valid_session_id, restore_session_state, persist_session_state
 import os
-import uuid
-import io
-from PIL import Image
 from dotenv import load_dotenv
 
 # Ladda miljövariabler från .env-filen
@@ -73,53 +73,35 @@ API_KEY = os.getenv("OPENAI_API_KEY")
 if not API_KEY:
     st.error("Ingen OpenAI API-nyckel hittades. Ange OPENAI_API_KEY i .env-filen eller som miljövariabel.")
 
-def generate_vision_image(prompt):
+# Öppna TLS-anslutningen till API:t i förväg (görs bara en gång per process)
+prewarm_connections()
+
+# Exponera mätvärden för anropen på /metrics (görs bara en gång per process)
+start_metrics_server()
+
+def generate_vision_image(prompt, quality="hd"):
     """Funktion för att generera målbild med DALL-E API"""
     if not API_KEY:
         st.error("Ingen OpenAI API-nyckel hittades.")
         return None
-        
-    url = "https://api.openai.com/v1/images/generations"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
-    
-    # Förbättra prompten för drömska bilder
-    enhanced_prompt = f"""
-    {prompt}
-    
-    Skapa en drömsk, nästan magisk bild med mjuka, glödande färger och en känsla av transformation. 
-    Bilden ska ha ett djup och en känslomässig kvalitet som inspirerar till hälsosamma val.
-    Använd en ljus, varm färgpalett med subtila blå och gröna toner som representerar hälsa och förnyelse.
-    """
     
-    data = {
-        "model": "dall-e-3",
-        "prompt": enhanced_prompt,  # Här använder vi den förbättrade prompten
-        "n": 1,
-        "size": "1024x1024",
-        "quality": "hd",
-        "style": "vivid"
-    }
-    
-    response = requests.post(url, headers=headers, json=data)
-    
-    if response.status_code == 200:
-        image_url = response.json()['data'][0]['url']
-        return image_url
-    else:
-        raise Exception(f"Fel vid API-anrop: {response.text}")
+    return request_image_url(prompt, quality, API_KEY)
 
 # Sessionhantering för att spara tidigare svar och användardata
 if 'user_data' not in st.session_state:
     st.session_state.user_data = {}
 if 'conversation_history' not in st.session_state:
     st.session_state.conversation_history = []
+if 'conversation_summary' not in st.session_state:
+    st.session_state.conversation_summary = None
 if 'current_stage' not in st.session_state:
     st.session_state.current_stage = 'intro'
-if 'pdf_path' not in st.session_state:
-    st.session_state.pdf_path = None
+if 'pdf_bytes' not in st.session_state:
+    st.session_state.pdf_bytes = None
+if 'pdf_version' not in st.session_state:
+    st.session_state.pdf_version = None
+if 'pdf_job_id' not in st.session_state:
+    st.session_state.pdf_job_id = None
 if 'food_analysis' not in st.session_state:
     st.session_state.food_analysis = None
 if 'food_image' not in st.session_state:
@@ -128,9 +110,21 @@ if 'manifest' not in st.session_state:
     st.session_state.manifest = None
 if 'vision_image' not in st.session_state:
     st.session_state.vision_image = None
+if 'vision_upgrade' not in st.session_state:
+    st.session_state.vision_upgrade = None
 if 'custom_image_mode' not in st.session_state:
     st.session_state.custom_image_mode = False
 
+# Bakom frontprocessen (server/proxy.py) har webbläsaren en sessionskaka. En ny
+# Streamlit-session, t.ex. efter att processen har startats om, läser då in
+# användarens sparade framsteg
+session_id = st.context.cookies.get(SESSION_COOKIE)
+if not valid_session_id(session_id):
+    session_id = None
+if session_id and st.session_state.get('restored_session_id') != session_id:
+    restore_session_state(st.session_state, session_id)
+    st.session_state.restored_session_id = session_id
+
 def main():
     """
     Huvudfunktionen som hanterar sidnavigering baserat på användarens aktuella steg i processen.
@@ -152,6 +146,10 @@ def main():
         longevity_page()
     elif st.session_state.current_stage == 'kursplan':
         kursplan_page()
+    
+    # Spara framstegen så att en annan Streamlit-process kan ta över sessionen
+    if session_id:
+        persist_session_state(st.session_state, session_id)
 
 if __name__ == "__main__":
     st.set_page_config(
@@ -0,0 +1,106 @@
+# backend/analysis_utils.py
+# Strukturerade fyrfältsanalyser (JSON-schema i stället för fri text)
+
+import json
+from dataclasses import dataclass, field
+
+# Sektioner per analystyp: (visningsnamn, JSON-nyckel)
+LONGEVITY_SECTIONS = [
+    ('Styrkefaktorer', 'styrkefaktorer'),
+    ('Utmaningar', 'utmaningar'),
+    ('Möjligheter', 'mojligheter'),
+    ('Livsvisdom', 'livsvisdom'),
+]
+SWOT_SECTIONS = [
+    ('Styrkor', 'styrkor'),
+    ('Svagheter', 'svagheter'),
+    ('Möjligheter', 'mojligheter'),
+    ('Hot', 'hot'),
+]
+
+# Rubrikord som används för att dela upp analyserna i fyra sektioner
+SWOT_SECTION_KEYWORDS = [
+    ('Styrkor', ['styrkor', 'strength']),
+    ('Svagheter', ['svagheter', 'weakness']),
+    ('Möjligheter', ['möjligheter', 'opportunit']),
+    ('Hot', ['hot', 'threat']),
+]
+LONGEVITY_SECTION_KEYWORDS = [
+    ('Styrkefaktorer', ['styrk', 'befintliga']),
+    ('Utmaningar', ['utmaning', 'minska']),
+    ('Möjligheter', ['möjlighet', 'införa']),
+    ('Livsvisdom', ['visdom', 'insikt']),
+]
+
+
+@dataclass
+class QuadrantAnalysis:
+    """
+    Resultatet av en fyrfältsanalys. sections håller punkterna per sektion i
+    visningsordning och text en valfri längre beskrivning.
+    """
+    sections: dict = field(default_factory=dict)
+    text: str = None
+
+    def to_markdown(self):
+        """Formaterar analysen som markdown för UI och PDF"""
+        parts = []
+        for name, items in self.sections.items():
+            parts.append(f"**{name}**")
+            parts.extend(f"- {item}" for item in items)
+            parts.append("")
+        if self.text:
+            parts.append(self.text)
+        return "\n".join(parts).strip()
+
+    def to_dict(self):
+        """Serialiserbar form för t.ex. sparade sessioner"""
+        return {"sections": self.sections, "text": self.text}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(sections=data.get("sections", {}), text=data.get("text"))
+
+    def __str__(self):
+        return self.to_markdown()
+
+
+def build_response_format(name, section_spec):
+    """Bygger response_format med ett strikt JSON-schema för fyra punktlistor"""
+    properties = {
+        key: {"type": "array", "items": {"type": "string"}}
+        for _, key in section_spec
+    }
+    properties["text"] = {"type": ["string", "null"]}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def parse_structured_response(content, section_spec):
+    """
+    Läser ett JSON-svar till en QuadrantAnalysis. Returnerar None om svaret
+    inte är giltig JSON (t.ex. ett felmeddelande).
+    """
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    sections = {}
+    for name, key in section_spec:
+        items = data.get(key) or []
+        sections[name] = [str(item).strip() for item in items if str(item).strip()]
+    return QuadrantAnalysis(sections=sections, text=data.get("text") or None)
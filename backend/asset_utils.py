@@ -0,0 +1,188 @@
+# backend/asset_utils.py
+# Avkodade bilder för PDF:en, cachade i minnet en gång per process
+
+import io
+import os
+import hashlib
+from collections import namedtuple
+from functools import lru_cache
+
+from PIL import Image
+
+from backend.http_utils import http_get, CONNECT_TIMEOUT, IMAGE_READ_TIMEOUT
+from backend.blob_store import get_blob_store, is_blob_ref
+
+# Ulrikas bild som används som vattenmärke och på slutsidan
+ULRIKA_IMAGE_PATH = "bilder/u.jpg"
+
+# Största bredd i pixlar; 80 mm i 150 dpi är ca 470 px
+STATIC_IMAGE_MAX_PX = 600
+VISION_IMAGE_MAX_PX = 600
+DIAGRAM_IMAGE_MAX_PX = 1800
+
+JPEG_QUALITY = 85
+
+# En färdig JPEG i minnet med dess mått
+ImageAsset = namedtuple("ImageAsset", ["key", "data", "width", "height", "channels"])
+
+# Storleksvarianter av genererade bilder. Varje variant skapas en gång per bild
+# och sparas i blob-lagret. Visningsvarianterna har exakt den bredd de visas i,
+# eftersom st.image annars skalar om och kodar om bilden vid varje omkörning;
+# av samma skäl är de JPEG och inte WebP, som st.image alltid kodar om.
+ImageVariant = namedtuple("ImageVariant", ["max_px", "format", "quality"])
+IMAGE_VARIANTS = {
+    "thumb": ImageVariant(100, "JPEG", 80),
+    "display": ImageVariant(400, "JPEG", 82),
+    "display_wide": ImageVariant(1460, "JPEG", 82),
+    "print": ImageVariant(VISION_IMAGE_MAX_PX, "JPEG", JPEG_QUALITY),
+    "print_wide": ImageVariant(DIAGRAM_IMAGE_MAX_PX, "JPEG", JPEG_QUALITY),
+}
+
+
+def _flatten(image):
+    """Gör om en PIL-bild till RGB eller gråskala, med vit bakgrund bakom genomskinliga delar"""
+    if image.mode in ("RGB", "L"):
+        return image
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background.paste(image, mask=image.split()[-1])
+    else:
+        background.paste(image.convert("RGB"))
+    return background
+
+
+def _encode_image(image, max_px, format="JPEG", quality=JPEG_QUALITY):
+    """Skalar ned en PIL-bild till högst max_px i bredd och kodar den"""
+    image = _flatten(image)
+    if image.width > max_px:
+        image = image.copy()
+        image.thumbnail((max_px, max_px * image.height // image.width), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    if format == "WEBP":
+        image.save(buf, format="WEBP", quality=quality, method=6)
+    else:
+        image.save(buf, format=format, quality=quality, optimize=True)
+    return buf.getvalue(), image
+
+
+def _to_jpeg_asset(image, max_px, key):
+    """Skalar ned en PIL-bild och kodar den som JPEG"""
+    data, image = _encode_image(image, max_px)
+    channels = 1 if image.mode == "L" else 3
+    return ImageAsset(key, data, image.width, image.height, channels)
+
+
+@lru_cache(maxsize=8)
+def load_static_image(path, max_px=STATIC_IMAGE_MAX_PX):
+    """Avkodar och skalar ned en statisk bild en gång per process. Returnerar None om filen saknas."""
+    if not os.path.exists(path):
+        return None
+    with Image.open(path) as image:
+        image.load()
+        return _to_jpeg_asset(image, max_px, f"static:{path}:{max_px}")
+
+
+@lru_cache(maxsize=32)
+def prepare_image_bytes(data, max_px=VISION_IMAGE_MAX_PX):
+    """Avkodar bilddata (t.ex. PNG från DALL-E eller diagrammet) till en cachad JPEG-asset"""
+    key = "mem:" + hashlib.sha256(data).hexdigest()[:16] + f":{max_px}"
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        return _to_jpeg_asset(image, max_px, key)
+
+
+def get_image_variant(ref, variant):
+    """
+    Returnerar blob-referensen till en storleksvariant (se IMAGE_VARIANTS) av
+    en bild i blob-lagret. Varianten skapas första gången den efterfrågas.
+    Returnerar None om originalet saknas.
+    """
+    spec = IMAGE_VARIANTS[variant]
+    store = get_blob_store()
+    derived = store.derived_ref(ref, f"{variant}:{spec.max_px}:{spec.format}:{spec.quality}")
+    if store.exists(derived):
+        return derived
+
+    data = store.get(ref)
+    if data is None:
+        return None
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        encoded, _ = _encode_image(image, spec.max_px, spec.format, spec.quality)
+    return store.put(encoded, ref=derived)
+
+
+@lru_cache(maxsize=32)
+def _load_variant_asset(ref, variant):
+    """Läser en JPEG-variant ur blob-lagret som ImageAsset; bara huvudet avkodas"""
+    derived = get_image_variant(ref, variant)
+    data = get_blob_store().get(derived) if derived else None
+    if data is None:
+        return None
+    with Image.open(io.BytesIO(data)) as image:
+        channels = 1 if image.mode == "L" else 3
+        return ImageAsset(derived, data, image.width, image.height, channels)
+
+
+def load_image_asset(image, variant):
+    """
+    Returnerar en ImageAsset i en utskriftsvariant ("print" eller "print_wide")
+    för PDF:en. Bilder i blob-lagret hämtas som färdig variant; bytes och
+    URL:er skalas ned i minnet. Returnerar None om bilden saknas.
+    """
+    if is_blob_ref(image):
+        return _load_variant_asset(image, variant)
+    data = load_image_data(image)
+    if not data:
+        return None
+    return prepare_image_bytes(data, IMAGE_VARIANTS[variant].max_px)
+
+
+def download_image(url):
+    """Hämtar en genererad bild en gång, så att bytes kan sparas och återanvändas"""
+    response = http_get(url, timeout=(CONNECT_TIMEOUT, IMAGE_READ_TIMEOUT))
+    response.raise_for_status()
+    return response.content
+
+
+def load_image_data(image):
+    """
+    Returnerar bilddata som bytes oavsett om bilden ges som bytes, buffer,
+    blob-referens eller URL. URL:er laddas ner som reserv för äldre sessioner.
+    Returnerar None om bilden inte finns.
+    """
+    if image is None:
+        return None
+    if hasattr(image, "getvalue"):
+        return image.getvalue()
+    if is_blob_ref(image):
+        return get_blob_store().get(image)
+    if isinstance(image, str):
+        return download_image(image)
+    return bytes(image)
+
+
+def place_image(pdf, asset, x=None, y=None, w=0):
+    """
+    Lägger in en ImageAsset i PDF:en direkt från minnet.
+
+    fpdf 1.7 läser bilder från fil, så den redan kodade JPEG:en registreras
+    i dokumentets bildtabell under asset.key innan image() anropas. fpdf2
+    tar emot en buffer direkt.
+    """
+    if not hasattr(pdf, "_parsejpg"):
+        return pdf.image(io.BytesIO(asset.data), x=x, y=y, w=w)
+
+    if asset.key not in pdf.images:
+        pdf.images[asset.key] = {
+            'w': asset.width,
+            'h': asset.height,
+            'cs': 'DeviceRGB' if asset.channels == 3 else 'DeviceGray',
+            'bpc': 8,
+            'f': 'DCTDecode',
+            'data': asset.data,
+            'i': len(pdf.images) + 1,
+        }
+    return pdf.image(asset.key, x=x, y=y, w=w, type='jpg')
@@ -0,0 +1,179 @@
+# backend/blob_store.py
+# Innehållsadresserad lagring av genererade bilder och diagram på disk
+
+import os
+import uuid
+import hashlib
+import threading
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", os.path.join(".cache", "blobs"))
+BLOB_STORE_MAX_BYTES = int(os.getenv("BLOB_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Referenser ser ut som "sha256:<hex>" och är små nog att ligga i session_state
+REF_PREFIX = "sha256:"
+
+
+def is_blob_ref(value):
+    """Sant om värdet är en referens till blob-lagret"""
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+class BlobStore:
+    """
+    Blobbar sparas under sin SHA-256 i en katalog delad i två nivåer
+    (ab/cd/abcd...), så identiska bilder bara lagras en gång. Filernas mtime
+    uppdateras vid läsning och de äldsta tas bort när lagret blir för stort.
+
+    Härledda blobbar (t.ex. nedskalade varianter av en bild) lagras under en
+    referens som räknas fram ur källans referens och ett namn, så att de kan
+    slås upp utan att källan behöver avkodas.
+    """
+
+    def __init__(self, root=BLOB_STORE_DIR, max_bytes=BLOB_STORE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def _digest(self, ref):
+        if not is_blob_ref(ref):
+            raise ValueError(f"Ogiltig blob-referens: {ref!r}")
+        return ref[len(REF_PREFIX):]
+
+    def derived_ref(self, ref, name):
+        """Referensen för en härledd blob, t.ex. derived_ref(ref, "thumb")"""
+        self._digest(ref)
+        return REF_PREFIX + hashlib.sha256(f"{ref}:{name}".encode("utf-8")).hexdigest()
+
+    def put(self, data, ref=None):
+        """
+        Sparar data och returnerar dess referens. Finns blobben redan
+        skrivs den inte igen, utan markeras bara som nyligen använd.
+        Härledda blobbar sparas under en ref från derived_ref().
+        """
+        if hasattr(data, "getvalue"):
+            data = data.getvalue()
+        data = bytes(data)
+        digest = self._digest(ref) if ref else hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+
+        if os.path.exists(path):
+            self._touch(path)
+            return REF_PREFIX + digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Skriv till en temporär fil först så att ingen läser en halv blob
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += len(data)
+            over_limit = self._total_bytes is None or self._total_bytes > self.max_bytes
+        if over_limit:
+            self.gc()
+        return REF_PREFIX + digest
+
+    def get(self, ref):
+        """Returnerar blobbens bytes, eller None om den saknas (t.ex. efter GC)"""
+        path = self._path(self._digest(ref))
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self._touch(path)
+        return data
+
+    def path(self, ref):
+        """Sökvägen till blobben på disk, eller None om den saknas"""
+        path = self._path(self._digest(ref))
+        return path if os.path.exists(path) else None
+
+    def exists(self, ref):
+        return self.path(ref) is not None
+
+    def delete(self, ref):
+        path = self._path(self._digest(ref))
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+        return True
+
+    def _touch(self, path):
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _scan(self):
+        """Listar alla blobbar som (mtime, storlek, sökväg)"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def gc(self, max_bytes=None):
+        """
+        Tar bort minst nyligen använda blobbar tills lagret ryms inom max_bytes.
+
+        Returns:
+            int: Antal borttagna blobbar
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            entries = self._scan()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self._total_bytes = total
+        return removed
+
+    def get_stats(self):
+        """Antal blobbar och total storlek"""
+        entries = self._scan()
+        return {
+            "blobs": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Returnerar processens delade BlobStore"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BlobStore()
+        return _store
@@ -0,0 +1,194 @@
+# backend/bulk_reports.py
+# Kommandoradsverktyg som bygger PDF-rapporter från sparade sessioner
+#
+# Kör med: python -m backend.bulk_reports "sparade/*.json" --out rapporter --workers 4
+
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import statistics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from backend.analysis_utils import QuadrantAnalysis
+from backend.blob_store import is_blob_ref
+from backend.diagram_utils import create_longevity_diagram
+from backend.pdf_utils import create_pdf_report
+
+
+def find_snapshots(patterns, from_store=False, stage=None):
+    """
+    Expanderar kataloger och globmönster till en sorterad lista av JSON-filer.
+    Med from_store läggs även sessionerna i sessionslagret till som store:<id>.
+    """
+    paths = set()
+    if from_store:
+        from backend.session_store import get_session_store
+        paths.update(f"store:{s['id']}" for s in get_session_store().find_sessions(stage=stage, limit=None))
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.json")
+        paths.update(p for p in glob.glob(pattern) if p.endswith(".json"))
+    return sorted(paths)
+
+
+def output_path_for(snapshot_path, out_dir):
+    """
+    PDF-filens sökväg för en given ögonblicksbild. Filer med samma namn i
+    olika kataloger skiljs åt med en kort hash av hela sökvägen; sessioner
+    i sessionslagret har redan unika id:n.
+    """
+    if snapshot_path.startswith("store:"):
+        return os.path.join(out_dir, f"session_{snapshot_path[len('store:'):]}.pdf")
+    name = os.path.splitext(os.path.basename(snapshot_path))[0]
+    digest = hashlib.sha256(os.path.abspath(snapshot_path).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(out_dir, f"{name}-{digest}.pdf")
+
+
+def load_snapshot(source):
+    """Läser en ögonblicksbild från en JSON-fil eller, med prefixet store:, från sessionslagret"""
+    if source.startswith("store:"):
+        from backend.session_store import get_session_store
+        snapshot = get_session_store().load_session(source[len("store:"):])
+        if snapshot is None:
+            raise KeyError(f"Sessionen {source} finns inte")
+        return snapshot
+    with open(source, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def render_snapshot(snapshot_path, out_path, fetch_images=False, engine=None):
+    """
+    Bygger en rapport från en ögonblicksbild och skriver den atomiskt, så att
+    en avbruten körning aldrig lämnar en halvfärdig PDF efter sig.
+
+    Returns:
+        float: Tid i sekunder för rapporten
+    """
+    start = time.perf_counter()
+    snapshot = load_snapshot(snapshot_path)
+
+    user_data = snapshot.get("user_data", {})
+    artifacts = snapshot.get("artifacts", {})
+
+    fyrfalt = artifacts.get("fyrfalt_analys")
+    if isinstance(fyrfalt, dict):
+        fyrfalt = QuadrantAnalysis.from_dict(fyrfalt)
+    fyrfalt_image = create_longevity_diagram(fyrfalt, engine=engine) if fyrfalt else None
+
+    # Bilder i blob-lagret läses lokalt; sparade bild-URL:er har oftast gått ut,
+    # så de hämtas bara på begäran
+    vision_image = artifacts.get("vision_image")
+    if not is_blob_ref(vision_image) and not fetch_images:
+        vision_image = None
+
+    pdf_bytes = create_pdf_report(
+        user_data,
+        fyrfalt_text=fyrfalt,
+        fyrfalt_image=fyrfalt_image,
+        livsmotto=artifacts.get("livsmotto"),
+        vision_image=vision_image,
+        full_analysis=True
+    )
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, out_path)
+    return time.perf_counter() - start
+
+
+def percentile(values, pct):
+    """Enkel percentil med närmaste rang"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run(patterns, out_dir, workers=None, force=False, fetch_images=False, engine=None, from_store=False, stage=None):
+    """
+    Bygger rapporter parallellt. Redan byggda rapporter hoppas över om inte
+    force=True, så en körning som avbröts eller hade fel kan återupptas.
+
+    Returns:
+        dict: Sammanfattning med antal, fel och genomströmning
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    snapshots = find_snapshots(patterns, from_store, stage)
+    todo = [
+        (path, output_path_for(path, out_dir)) for path in snapshots
+        if force or not os.path.exists(output_path_for(path, out_dir))
+    ]
+    skipped = len(snapshots) - len(todo)
+
+    durations = []
+    failures = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(render_snapshot, path, out_path, fetch_images, engine): path
+            for path, out_path in todo
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                durations.append(future.result())
+            except Exception as e:
+                failures.append({"snapshot": path, "error": str(e)})
+                print(f"Misslyckades: {path}: {e}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+
+    # Felen sparas så att de kan undersökas; nästa körning försöker igen automatiskt
+    if failures:
+        with open(os.path.join(out_dir, "failures.jsonl"), "a", encoding="utf-8") as f:
+            for failure in failures:
+                f.write(json.dumps(failure, ensure_ascii=False) + "\n")
+
+    return {
+        "total": len(snapshots),
+        "skipped": skipped,
+        "rendered": len(durations),
+        "failed": len(failures),
+        "elapsed_s": elapsed,
+        "reports_per_s": len(durations) / elapsed if elapsed > 0 else 0.0,
+        "p50_s": statistics.median(durations) if durations else 0.0,
+        "p95_s": percentile(durations, 95),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bygg PDF-rapporter från sparade sessioner")
+    parser.add_argument("snapshots", nargs="*", help="Kataloger eller globmönster med JSON-ögonblicksbilder")
+    parser.add_argument("--store", action="store_true", help="Ta även med sessionerna i sessionslagret")
+    parser.add_argument("--stage", help="Bara sessioner i detta steg (med --store)")
+    parser.add_argument("--out", default="rapporter", help="Katalog för färdiga PDF:er")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Antal arbetsprocesser")
+    parser.add_argument("--force", action="store_true", help="Bygg om även redan färdiga rapporter")
+    parser.add_argument("--fetch-images", action="store_true", help="Hämta sparade målbilds-URL:er")
+    parser.add_argument("--engine", choices=["matplotlib", "pillow"], help="Renderingsmotor för fyrfältsdiagrammet")
+    parser.add_argument("--json", action="store_true", help="Skriv sammanfattningen som JSON")
+    args = parser.parse_args(argv)
+
+    summary = run(args.snapshots, args.out, args.workers, args.force, args.fetch_images, args.engine,
+                  from_store=args.store, stage=args.stage)
+
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"Rapporter: {summary['rendered']} byggda, {summary['skipped']} redan klara, "
+              f"{summary['failed']} misslyckade av {summary['total']}")
+        print(f"Tid: {summary['elapsed_s']:.1f} s, {summary['reports_per_s']:.2f} rapporter/s")
+        print(f"Per rapport: p50 {summary['p50_s'] * 1000:.0f} ms, p95 {summary['p95_s'] * 1000:.0f} ms")
+
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
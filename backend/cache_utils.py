@@ -0,0 +1,202 @@
+# backend/cache_utils.py
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from collections import OrderedDict
+
+# Inställningar för svarscachen, kan överskridas med miljövariabler
+CACHE_DIR = os.getenv("CHAT_CACHE_DIR", ".cache")
+CACHE_TTL_SECONDS = int(os.getenv("CHAT_CACHE_TTL", str(24 * 60 * 60)))
+CACHE_MAX_BYTES = int(os.getenv("CHAT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+CACHE_MAX_DISK_BYTES = int(os.getenv("CHAT_CACHE_MAX_DISK_BYTES", str(256 * 1024 * 1024)))
+# Diskcachen rensas vid start och därefter efter så här många skrivningar
+CACHE_PURGE_EVERY = int(os.getenv("CHAT_CACHE_PURGE_EVERY", "200"))
+
+
+def make_cache_key(model, messages, temperature, max_tokens, response_format=None):
+    """Skapar en kanonisk hash av ett chat-anrop att använda som cachenyckel"""
+    request = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if response_format is not None:
+        request["response_format"] = response_format
+    payload = json.dumps(
+        request,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Tvånivåcache för chattsvar: en LRU i minnet som begränsas av total
+    storlek i bytes, och en SQLite-fil på disk där posterna har en TTL och
+    den totala storleken är begränsad.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl_seconds=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES,
+                 max_disk_bytes=CACHE_MAX_DISK_BYTES, purge_every=CACHE_PURGE_EVERY):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.purge_every = purge_every
+        self._puts_since_purge = 0
+        self.db_path = os.path.join(cache_dir, "chat_cache.sqlite") if cache_dir else None
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+        if self.db_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                with self._connect() as conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS responses ("
+                        "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                    )
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)"
+                    )
+                self.purge_expired()
+            except Exception as e:
+                print(f"Kunde inte öppna diskcachen, använder bara minnescache: {e}")
+                self.db_path = None
+
+    @contextmanager
+    def _connect(self):
+        """Öppnar en anslutning som checkas in vid lyckat block och alltid stängs"""
+        with closing(sqlite3.connect(self.db_path, timeout=5)) as conn:
+            with conn:
+                yield conn
+
+    def _remember(self, key, value):
+        """Lägger in ett värde i minnes-LRU:n och vräker äldsta poster vid behov"""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= len(self._memory.pop(key).encode("utf-8"))
+            self._memory[key] = value
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted.encode("utf-8"))
+
+    def get(self, key):
+        """Returnerar cachat svar eller None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and time.time() - row[1] <= self.ttl_seconds:
+                        self._remember(key, row[0])
+                        with self._lock:
+                            self.stats["disk_hits"] += 1
+                        return row[0]
+                    if row:
+                        # Posten har gått ut
+                        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            except Exception as e:
+                print(f"Kunde inte läsa från diskcachen: {e}")
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        """Sparar ett svar i båda cachenivåerna"""
+        self._remember(key, value)
+        with self._lock:
+            self.stats["stores"] += 1
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                        (key, value, time.time()),
+                    )
+            except Exception as e:
+                print(f"Kunde inte skriva till diskcachen: {e}")
+                return
+            with self._lock:
+                self._puts_since_purge += 1
+                due = self._puts_since_purge >= self.purge_every
+                if due:
+                    self._puts_since_purge = 0
+            if due:
+                try:
+                    self.purge_expired()
+                except Exception as e:
+                    print(f"Kunde inte rensa diskcachen: {e}")
+
+    def purge_expired(self):
+        """
+        Tar bort utgångna poster från diskcachen och därefter de äldsta
+        posterna tills filens innehåll ryms inom max_disk_bytes
+        
+        Returns:
+            int: Antal borttagna poster
+        """
+        if not self.db_path:
+            return 0
+        with self._connect() as conn:
+            removed = conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            # Behåll de nyaste posterna vars sammanlagda storlek ryms i gränsen
+            removed += conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(length(CAST(value AS BLOB))) "
+                "OVER (ORDER BY created_at DESC, key) AS total FROM responses) "
+                "WHERE total > ?)",
+                (self.max_disk_bytes,),
+            ).rowcount
+        return removed
+
+    def clear(self):
+        """Tömmer båda cachenivåerna"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses")
+
+    def get_stats(self):
+        """Returnerar träff-/missräknare samt minnesanvändning"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+# Delad cache för hela processen
+response_cache = ResponseCache()
+
+
+def get_cache_stats():
+    """Returnerar statistik för den delade svarscachen"""
+    return response_cache.get_stats()
@@ -0,0 +1,267 @@
+# backend/cassette.py
+# Inspelning och uppspelning av HTTP-trafik (OpenAI, bildnedladdning, webbsök)
+# så att mätningar och profilering kan upprepas exakt utan nätverk.
+#
+# Styrs med miljövariabler:
+#   CASSETTE_MODE  - off (standard), record eller replay
+#   CASSETTE_PATH  - kassettfilen, t.ex. kassetter/resa.jsonl.gz
+#   CASSETTE_SPEED - recorded (inspelad takt), fast (så snabbt som möjligt)
+#                    eller en faktor, t.ex. 2 för dubbel hastighet
+
+import os
+import gzip
+import json
+import time
+import base64
+import hashlib
+import datetime
+import threading
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:
+    # Utan fcntl (Windows) skyddas filen bara mot trådar i samma process
+    fcntl = None
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", os.path.join(".cache", "cassette.jsonl.gz"))
+CASSETTE_SPEED = os.getenv("CASSETTE_SPEED", "recorded")
+
+# Svarshuvuden som sparas; övriga (datum, id:n, cookies) gör bara kassetten större
+KEPT_HEADERS = {"content-type", "content-encoding"}
+
+
+class CassetteMiss(Exception):
+    """Kastas vid uppspelning när en förfrågan saknas i kassetten"""
+
+
+def request_key(method, url, body):
+    """
+    Nyckel för en förfrågan: metod, sökväg med query och kroppen. Värd och
+    port ingår inte, så en inspelning mot en lokal server kan spelas upp
+    oavsett port. JSON-kroppar normaliseras.
+    """
+    parts = urlsplit(str(url))
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+        except (ValueError, UnicodeDecodeError):
+            pass
+    digest = hashlib.sha256(body or b"").hexdigest()[:32]
+    return f"{method.upper()} {target} {digest}"
+
+
+class Cassette:
+    """
+    En kassett är en gzip-komprimerad JSONL-fil med en rad per anrop:
+    nyckel, status, utvalda svarshuvuden och svarskroppen som bitar med
+    tiden sedan föregående bit (den första biten räknas från förfrågan).
+    Identiska förfrågningar spelas upp i den ordning de spelades in.
+    
+    Vid inspelning lägger varje process till sina anrop under ett fillås,
+    så att Streamlit-processer och PDF-arbetare kan dela samma kassett.
+    Filen töms bara av start_recording.
+    """
+
+    def __init__(self, path=CASSETTE_PATH, mode=CASSETTE_MODE, speed=CASSETTE_SPEED):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._interactions = {}
+        self._positions = {}
+        if mode == "replay":
+            self._load()
+        elif mode == "record":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    self._interactions.setdefault(interaction["key"], []).append(interaction)
+
+    def record(self, key, status, headers, chunks):
+        """Sparar ett anrop; chunks är en lista av (sekunder, bytes)"""
+        interaction = {
+            "key": key,
+            "status": status,
+            "headers": {k.lower(): v for k, v in headers.items() if k.lower() in KEPT_HEADERS},
+            "chunks": [[round(dt, 4), base64.b64encode(data).decode("ascii")] for dt, data in chunks],
+        }
+        line = json.dumps(interaction, separators=(",", ":")) + "\n"
+        # gzip-filer kan läggas efter varandra och läses ändå som en fil
+        data = gzip.compress(line.encode("utf-8"))
+        with self._lock, open(self.path, "ab") as f:
+            if fcntl is not None:
+                # Låset släpps när filen stängs
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(data)
+
+    def next(self, key):
+        """Nästa inspelade svar för nyckeln; det sista återanvänds om de tar slut"""
+        with self._lock:
+            interactions = self._interactions.get(key)
+            if not interactions:
+                raise CassetteMiss(f"Förfrågan finns inte i kassetten {self.path}: {key}")
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            return interactions[min(position, len(interactions) - 1)]
+
+    def wait(self, seconds):
+        """Väntar enligt inställd uppspelningstakt"""
+        if self.speed == "fast" or seconds <= 0:
+            return
+        factor = 1.0 if self.speed == "recorded" else float(self.speed)
+        time.sleep(seconds / factor)
+
+    def replay_chunks(self, interaction):
+        """Yieldar svarskroppens bitar i inspelad takt"""
+        for dt, data in interaction["chunks"]:
+            self.wait(dt)
+            yield base64.b64decode(data)
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    """Skickar vidare svarets bitar och sparar dem med tidpunkter när strömmen stängs"""
+
+    def __init__(self, cassette, key, response, start):
+        self.cassette = cassette
+        self.key = key
+        self.response = response
+        self.chunks = []
+        self._last = start
+
+    def __iter__(self):
+        for data in self.response.stream:
+            now = time.perf_counter()
+            self.chunks.append((now - self._last, data))
+            self._last = now
+            yield data
+
+    def close(self):
+        self.response.close()
+        self.cassette.record(self.key, self.response.status_code, self.response.headers, self.chunks)
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, cassette, interaction):
+        self.cassette = cassette
+        self.interaction = interaction
+
+    def __iter__(self):
+        yield from self.cassette.replay_chunks(self.interaction)
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """httpx-transport för OpenAI-klienten som spelar in eller spelar upp anrop"""
+
+    def __init__(self, cassette, inner=None):
+        self.cassette = cassette
+        self.inner = inner
+
+    def handle_request(self, request):
+        key = request_key(request.method, request.url, request.read())
+        if self.cassette.mode == "replay":
+            interaction = self.cassette.next(key)
+            return httpx.Response(
+                interaction["status"],
+                headers=interaction["headers"],
+                stream=_ReplayStream(self.cassette, interaction),
+                request=request,
+            )
+
+        start = time.perf_counter()
+        response = self.inner.handle_request(request)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(self.cassette, key, response, start),
+            request=request,
+            extensions=response.extensions,
+        )
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+
+class CassetteAdapter(HTTPAdapter):
+    """
+    requests-adapter för bildanrop, bildnedladdningar och webbsök. Svaren
+    är inte strömmande, så bara tiden till svarshuvudena och resten av
+    kroppen sparas som två bitar.
+    """
+
+    def __init__(self, cassette, **kwargs):
+        self.cassette = cassette
+        super().__init__(**kwargs)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else request.body
+        key = request_key(request.method, request.url, body)
+
+        if self.cassette.mode == "replay":
+            interaction = self.cassette.next(key)
+            start = time.perf_counter()
+            chunks = self.cassette.replay_chunks(interaction)
+            first = next(chunks, b"")
+            elapsed = time.perf_counter() - start
+            return self._build_replayed(request, interaction, first + b"".join(chunks), elapsed)
+
+        start = time.perf_counter()
+        response = super().send(request, stream=True, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        headers_at = time.perf_counter()
+        content = response.content
+        done_at = time.perf_counter()
+        # Innehållet är redan avkodat, så content-encoding sparas inte
+        headers = {k: v for k, v in response.headers.items() if k.lower() != "content-encoding"}
+        self.cassette.record(key, response.status_code, headers, [(headers_at - start, b""), (done_at - headers_at, content)])
+        return response
+
+    def _build_replayed(self, request, interaction, content, elapsed):
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.reason = "OK" if response.status_code < 400 else "Error"
+        response.elapsed = datetime.timedelta(seconds=elapsed)
+        response.connection = self
+        return response
+
+
+def start_recording(path=CASSETTE_PATH):
+    """
+    Tömmer kassettfilen inför en ny inspelning. Anropas en gång av den som
+    startar körningen, innan några processer har börjat spela in.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    open(path, "wb").close()
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """Processens kassett, eller None när CASSETTE_MODE=off"""
+    global _cassette
+    if CASSETTE_MODE not in ("record", "replay"):
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette()
+        return _cassette
@@ -0,0 +1,415 @@
+# backend/diagram_utils.py
+# Tolkning och ritning av fyrfältsdiagram (SWOT och longevity)
+
+import io
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from backend.analysis_utils import QuadrantAnalysis, SWOT_SECTION_KEYWORDS, LONGEVITY_SECTION_KEYWORDS
+
+# Punktlistetecken som inleder en rad med innehåll
+BULLET_PREFIXES = ('•', '-', '*', '1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.')
+
+# Max antal punkter som visas per kvadrant
+MAX_ITEMS = 7
+
+# Diagrammets storlek: 12x10 tum i 150 dpi
+DIAGRAM_SIZE = (1800, 1500)
+DIAGRAM_DPI = 150
+
+# Standardmotor för diagrammen, "matplotlib" eller "pillow"
+DIAGRAM_ENGINE = os.getenv("DIAGRAM_ENGINE", "matplotlib")
+
+# Antal färdiga diagram som hålls i minnet
+DIAGRAM_CACHE_SIZE = int(os.getenv("DIAGRAM_CACHE_SIZE", "64"))
+
+# Serialiserar matplotlib-rendering mellan trådar
+_matplotlib_lock = threading.Lock()
+
+
+def parse_quadrant_sections(text, section_keywords):
+    """
+    Delar upp en analys i fyra sektioner utifrån rubrikord.
+
+    Args:
+        text (str): Analystexten från GPT
+        section_keywords (list): Lista av (sektionsnamn, [nyckelord]) i prioritetsordning
+
+    Returns:
+        dict: sektionsnamn -> lista av punkter
+    """
+    sections = {}
+    current_section = None
+    current_content = []
+
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        lowered = line.lower()
+        header = next(
+            (name for name, keywords in section_keywords if any(k in lowered for k in keywords)),
+            None
+        )
+        if header:
+            if current_section and current_content:
+                sections[current_section] = current_content
+            current_section = header
+            current_content = []
+        elif current_section and line.startswith(BULLET_PREFIXES):
+            # Rensa bort punktlistetecken
+            item = line.lstrip('•-*123456789. ')
+            current_content.append(item)
+
+    # Lägg till den sista sektionen
+    if current_section and current_content:
+        sections[current_section] = current_content
+
+    return sections
+
+
+def create_swot_diagram(swot_text, engine=None):
+    """Skapar en visuell SWOT-diagram från text"""
+    # Strukturerade analyser har redan sektionerna, fri text måste tolkas
+    if isinstance(swot_text, QuadrantAnalysis):
+        sections = swot_text.sections
+    else:
+        sections = parse_quadrant_sections(swot_text, SWOT_SECTION_KEYWORDS)
+
+    # Definiera färger för varje sektion
+    colors = {
+        'Styrkor': '#4CAF50',      # Grön
+        'Svagheter': '#F44336',    # Röd
+        'Möjligheter': '#2196F3',  # Blå
+        'Hot': '#FF9800'           # Orange
+    }
+
+    sections_order = ['Styrkor', 'Svagheter', 'Möjligheter', 'Hot']
+    return render_quadrant_diagram(sections, sections_order, colors, engine=engine)
+
+
+def create_longevity_diagram(longevity_text, engine=None):
+    """Skapar en visuell fyrfältare från text om longevity"""
+    # Strukturerade analyser har redan sektionerna, fri text tolkas med andra sektionsnamn än SWOT
+    if isinstance(longevity_text, QuadrantAnalysis):
+        sections = longevity_text.sections
+    else:
+        sections = parse_quadrant_sections(longevity_text, LONGEVITY_SECTION_KEYWORDS)
+
+    # Definiera färger för varje sektion - anpassade till longevity-tema
+    colors = {
+        'Styrkefaktorer': '#388E3C',   # Mörkgrön
+        'Utmaningar': '#F57C00',       # Orange
+        'Möjligheter': '#1976D2',      # Blå
+        'Livsvisdom': '#7B1FA2'        # Lila
+    }
+
+    sections_order = ['Styrkefaktorer', 'Utmaningar', 'Möjligheter', 'Livsvisdom']
+    return render_quadrant_diagram(sections, sections_order, colors, engine=engine)
+
+
+def render_quadrant_diagram(sections, sections_order, colors, engine=None, fmt="png", dpi=DIAGRAM_DPI):
+    """
+    Ritar ett fyrfältsdiagram och returnerar en BytesIO med bilddata.
+
+    Färdiga bilder cachas på en hash av innehåll, motor, format och dpi så att
+    samma analys aldrig rastreras två gånger.
+
+    Args:
+        sections (dict): sektionsnamn -> lista av punkter
+        sections_order (list): De fyra sektionerna i ordningen vänster-höger, uppifrån och ned
+        colors (dict): sektionsnamn -> hexfärg
+        engine (str): "matplotlib" eller "pillow", standard är DIAGRAM_ENGINE
+        fmt (str): Bildformat, t.ex. "png"
+        dpi (int): Upplösning (Pillow-motorn ritar alltid i DIAGRAM_DPI)
+    """
+    engine = engine or DIAGRAM_ENGINE
+    if engine == "pillow":
+        renderer = _render_with_pillow
+    elif engine == "matplotlib":
+        renderer = _render_with_matplotlib
+    else:
+        raise ValueError(f"Okänd renderingsmotor: {engine}")
+
+    key = _diagram_cache_key(sections, sections_order, colors, engine, fmt, dpi)
+    data = _diagram_cache.get(key)
+    if data is None:
+        data = renderer(sections, sections_order, colors, fmt, dpi)
+        _diagram_cache.set(key, data)
+
+    # Ny buffer per anrop så att anroparna inte delar läsposition
+    return io.BytesIO(data)
+
+
+def _diagram_cache_key(sections, sections_order, colors, engine, fmt, dpi):
+    payload = json.dumps(
+        {
+            "sections": {name: sections.get(name) for name in sections_order},
+            "order": list(sections_order),
+            "colors": colors,
+            "engine": engine,
+            "format": fmt,
+            "dpi": dpi,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _RenderedDiagramCache:
+    """Liten trådsäker LRU för färdiga diagrambilder"""
+
+    def __init__(self, max_entries=DIAGRAM_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, data):
+        with self._lock:
+            self._items[key] = data
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_diagram_cache = _RenderedDiagramCache()
+
+
+def clear_diagram_cache():
+    """Tömmer diagramcachen"""
+    _diagram_cache.clear()
+
+
+def get_diagram_cache_stats():
+    """Returnerar träffar/missar för diagramcachen"""
+    return {
+        "hits": _diagram_cache.hits,
+        "misses": _diagram_cache.misses,
+        "entries": len(_diagram_cache._items),
+    }
+
+
+def _render_with_matplotlib(sections, sections_order, colors, fmt, dpi):
+    """
+    Ritar med matplotlibs objektorienterade API (Figure + Agg-canvas) i stället
+    för pyplot, så att ingen global figurstatus delas mellan sessioner och
+    figuren kan frigöras direkt. Ritningen serialiseras med ett lås eftersom
+    typsnittsrenderingen i Agg inte är trådsäker.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    with _matplotlib_lock:
+        # Skapa en figur med 2x2 rutnät
+        fig = Figure(figsize=(12, 10))
+        FigureCanvasAgg(fig)
+        try:
+            fig.patch.set_facecolor('#f0f0f0')
+            axs = fig.subplots(2, 2)
+
+            positions = [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+            for (section, pos) in zip(sections_order, positions):
+                i, j = pos
+                ax = axs[i, j]
+
+                # Sätt bakgrundsfärg
+                ax.set_facecolor(colors.get(section, '#EEEEEE') + '22')  # Lägg till transparens
+
+                # Sätt titel
+                ax.set_title(section, fontsize=14, fontweight='bold', color=colors.get(section, '#333333'))
+
+                # Lägg till innehåll
+                content = sections.get(section) or ['Ingen information tillgänglig']
+                y_pos = 0.9
+                for item in content[:MAX_ITEMS]:
+                    if len(item) > 60:
+                        item = item[:57] + '...'  # Begränsa textlängd för visning
+                    ax.text(0.1, y_pos, f"• {item}", fontsize=10, va='top', wrap=True)
+                    y_pos -= 0.12
+
+                # Ta bort axlar
+                ax.set_xticks([])
+                ax.set_yticks([])
+                for spine in ax.spines.values():
+                    spine.set_visible(False)
+
+            fig.tight_layout()
+
+            # Spara figuren till en buffer
+            buf = io.BytesIO()
+            fig.savefig(buf, format=fmt, dpi=dpi)
+            return buf.getvalue()
+        finally:
+            fig.clear()
+
+
+# --- Pillow-motor ---------------------------------------------------------
+
+# Typsnitt som provas i ordning; DejaVu följer med matplotlib och de flesta Linux-distar
+FONT_CANDIDATES = {
+    "regular": ["DejaVuSans.ttf", "Arial.ttf", "arial.ttf"],
+    "bold": ["DejaVuSans-Bold.ttf", "Arial Bold.ttf", "arialbd.ttf"],
+}
+
+# Typsnittsstorlekar i pixlar (14 pt resp. 10 pt i 150 dpi)
+TITLE_FONT_SIZE = 29
+BODY_FONT_SIZE = 21
+
+OUTER_MARGIN = 30
+GUTTER = 40
+TITLE_HEIGHT = 60
+LINE_SPACING = 6
+ITEM_SPACING = 14
+
+
+def _hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _blend(color, background, alpha):
+    return tuple(round(c * alpha + b * (1 - alpha)) for c, b in zip(color, background))
+
+
+def _find_font_file(style):
+    """Letar upp en TrueType-fil, i första hand den som följer med matplotlib"""
+    names = FONT_CANDIDATES[style]
+    try:
+        import matplotlib
+        font_dir = os.path.join(matplotlib.get_data_path(), "fonts", "ttf")
+        for name in names:
+            path = os.path.join(font_dir, name)
+            if os.path.exists(path):
+                return path
+    except ImportError:
+        pass
+    return names[0]
+
+
+@lru_cache(maxsize=None)
+def _load_font(style, size):
+    """Laddar ett typsnitt en gång per process"""
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype(_find_font_file(style), size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:
+            # Äldre Pillow saknar storleksparameter
+            return ImageFont.load_default()
+
+
+def _quadrant_boxes():
+    """Beräknar de fyra kvadranternas (x0, y0, x1, y1) i bilden"""
+    width, height = DIAGRAM_SIZE
+    box_w = (width - 2 * OUTER_MARGIN - GUTTER) // 2
+    box_h = (height - 2 * OUTER_MARGIN - GUTTER - 2 * TITLE_HEIGHT) // 2
+    boxes = []
+    for row in range(2):
+        for col in range(2):
+            x0 = OUTER_MARGIN + col * (box_w + GUTTER)
+            y0 = OUTER_MARGIN + TITLE_HEIGHT + row * (box_h + GUTTER + TITLE_HEIGHT)
+            boxes.append((x0, y0, x0 + box_w, y0 + box_h))
+    return boxes
+
+
+@lru_cache(maxsize=16)
+def _quadrant_background(sections_order, color_items):
+    """
+    Förrenderar bakgrund, färgade kvadranter och rubriker en gång per
+    kombination av sektioner och färger.
+    """
+    from PIL import Image, ImageDraw
+
+    colors = dict(color_items)
+    background = _hex_to_rgb('#f0f0f0')
+    image = Image.new("RGB", DIAGRAM_SIZE, background)
+    draw = ImageDraw.Draw(image)
+    title_font = _load_font("bold", TITLE_FONT_SIZE)
+
+    for section, box in zip(sections_order, _quadrant_boxes()):
+        color = _hex_to_rgb(colors.get(section, '#EEEEEE'))
+        # Motsvarar matplotlibs färg + '22' (alfa ca 0.13) mot figurens bakgrund
+        draw.rectangle(box, fill=_blend(color, background, 0x22 / 255))
+        title_width = draw.textlength(section, font=title_font)
+        x = box[0] + (box[2] - box[0] - title_width) / 2
+        draw.text((x, box[1] - TITLE_HEIGHT + 15), section, font=title_font,
+                  fill=_hex_to_rgb(colors.get(section, '#333333')))
+
+    return image
+
+
+def wrap_text(text, font, max_width):
+    """Radbryter text efter uppmätt bredd i stället för antal tecken"""
+    words = text.split()
+    lines = []
+    current = ""
+    for word in words:
+        candidate = f"{current} {word}".strip()
+        if font.getlength(candidate) <= max_width or not current:
+            current = candidate
+        else:
+            lines.append(current)
+            current = word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _render_with_pillow(sections, sections_order, colors, fmt, dpi):
+    from PIL import ImageDraw
+
+    image = _quadrant_background(tuple(sections_order), tuple(sorted(colors.items()))).copy()
+    draw = ImageDraw.Draw(image)
+    body_font = _load_font("regular", BODY_FONT_SIZE)
+    ascent, descent = body_font.getmetrics()
+    line_height = ascent + descent + LINE_SPACING
+
+    for section, box in zip(sections_order, _quadrant_boxes()):
+        x0, y0, x1, y1 = box
+        text_x = x0 + int((x1 - x0) * 0.1)
+        max_width = x1 - 20 - text_x
+        bullet_width = body_font.getlength("• ")
+        y = y0 + 30
+
+        content = sections.get(section) or ['Ingen information tillgänglig']
+        for item in content[:MAX_ITEMS]:
+            lines = wrap_text(item, body_font, max_width - bullet_width)
+            for index, line in enumerate(lines):
+                if y + line_height > y1 - 10:
+                    break
+                if index == 0:
+                    draw.text((text_x, y), "•", font=body_font, fill=(0, 0, 0))
+                draw.text((text_x + bullet_width, y), line, font=body_font, fill=(0, 0, 0))
+                y += line_height
+            y += ITEM_SPACING
+
+    buf = io.BytesIO()
+    if fmt.lower() == "png":
+        image.save(buf, format="PNG", dpi=(DIAGRAM_DPI, DIAGRAM_DPI), compress_level=1)
+    else:
+        image.save(buf, format=fmt.upper(), dpi=(DIAGRAM_DPI, DIAGRAM_DPI))
+    return buf.getvalue()
@@ -0,0 +1,124 @@
+# backend/http_utils.py
+# Gemensam HTTP-transport för alla utgående anrop (OpenAI, bildnedladdning, webbsök)
+
+import os
+import threading
+
+# requests, httpx och kassettlagret importeras först när en klient skapas,
+# så att appen inte väntar på dem vid start
+
+# Bas-URL för OpenAI-API:t, kan pekas om mot t.ex. en lokal testserver
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+
+# Tidsgränser i sekunder (anslutning, läsning)
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+IMAGE_READ_TIMEOUT = float(os.getenv("HTTP_IMAGE_READ_TIMEOUT", "120"))
+DEFAULT_TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+# Storlek på anslutningspoolerna
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+
+_session = None
+_openai_http_client = None
+_lock = threading.Lock()
+_prewarmed = False
+
+
+def get_http_session():
+    """Returnerar processens delade requests-session med keep-alive-pool"""
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from backend.cassette import get_cassette, CassetteAdapter
+
+            session = requests.Session()
+            pool_args = dict(
+                pool_connections=POOL_CONNECTIONS,
+                pool_maxsize=POOL_MAXSIZE,
+                max_retries=1,
+            )
+            cassette = get_cassette()
+            if cassette is not None:
+                adapter = CassetteAdapter(cassette, **pool_args)
+            else:
+                adapter = HTTPAdapter(**pool_args)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _http2_available():
+    """HTTP/2 i httpx kräver paketet h2"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_openai_http_client():
+    """Returnerar den delade httpx-klienten som OpenAI-klienten använder"""
+    global _openai_http_client
+    with _lock:
+        if _openai_http_client is None:
+            import httpx
+            from backend.cassette import get_cassette, CassetteTransport
+
+            http2 = _http2_available()
+            limits = httpx.Limits(
+                max_connections=POOL_MAXSIZE,
+                max_keepalive_connections=POOL_CONNECTIONS,
+                keepalive_expiry=60,
+            )
+            transport = None
+            cassette = get_cassette()
+            if cassette is not None:
+                # Kassetten ligger under OpenAI-klienten och spelar in eller upp all dess trafik
+                transport = CassetteTransport(cassette, httpx.HTTPTransport(http2=http2, limits=limits))
+            _openai_http_client = httpx.Client(
+                http2=http2,
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                limits=limits,
+                transport=transport,
+            )
+        return _openai_http_client
+
+
+def http_get(url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """GET via den delade sessionen med tidsgränser"""
+    return get_http_session().get(url, timeout=timeout, **kwargs)
+
+
+def http_post(url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """POST via den delade sessionen med tidsgränser"""
+    return get_http_session().post(url, timeout=timeout, **kwargs)
+
+
+def _prewarm():
+    try:
+        # Svarskoden spelar ingen roll, poängen är att TLS-anslutningen hamnar i poolen
+        get_openai_http_client().get(OPENAI_BASE_URL + "/models", timeout=CONNECT_TIMEOUT)
+    except Exception as e:
+        print(f"Kunde inte förvärma anslutningen till {OPENAI_BASE_URL}: {e}")
+
+
+def prewarm_connections():
+    """
+    Öppnar TLS-anslutningen till API-värden i bakgrunden en gång per process,
+    så att första användaranropet slipper handskakningen.
+    """
+    global _prewarmed
+    if os.getenv("CASSETTE_MODE", "off") in ("record", "replay"):
+        # Med kassett finns ingen anslutning att värma, och anropet skulle hamna i inspelningen.
+        # Miljövariabeln läses direkt så att kassettlagret inte importeras vid start.
+        return
+    with _lock:
+        if _prewarmed:
+            return
+        _prewarmed = True
+    threading.Thread(target=_prewarm, name="http-prewarm", daemon=True).start()
@@ -0,0 +1,149 @@
+# backend/job_utils.py
+# PDF-generering som jobb i en begränsad processpool, med förlopp och avbrytning
+
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.pdf_utils import create_pdf_report, PdfCancelled, PDF_SECTIONS
+
+# Max antal rapporter som byggs samtidigt
+PDF_JOB_WORKERS = int(os.getenv("PDF_JOB_WORKERS", "2"))
+
+# Avslutade jobb som ingen session har hämtat glöms efter så här många sekunder
+PDF_JOB_TTL = float(os.getenv("PDF_JOB_TTL", "600"))
+
+
+def _run_pdf_job(job_id, shared, kwargs):
+    """Körs i en arbetsprocess; rapporterar förlopp och avbryter vid begäran"""
+    def progress(section):
+        if shared.get(f"{job_id}:cancel"):
+            raise PdfCancelled(f"Jobb {job_id} avbröts")
+        shared[job_id] = {"section": section, "done": PDF_SECTIONS.index(section), "total": len(PDF_SECTIONS)}
+
+    result = create_pdf_report(progress=progress, **kwargs)
+    shared[job_id] = {"section": "klar", "done": len(PDF_SECTIONS), "total": len(PDF_SECTIONS)}
+    return result
+
+
+class PdfJobManager:
+    """
+    Håller reda på PDF-jobb för hela processen. Sessionerna sparar bara
+    jobb-id:t i st.session_state och frågar efter status och resultat.
+    Jobb vars session har återställts eller övergetts glöms PDF_JOB_TTL
+    sekunder efter att de avslutats, så att resultaten inte ligger kvar i minnet.
+    """
+
+    def __init__(self, max_workers=PDF_JOB_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._manager = None
+        self._shared = None
+        self._jobs = {}
+        self._finished_at = {}
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._executor is None:
+            # spawn i stället för fork eftersom Streamlit-processen har många trådar
+            context = multiprocessing.get_context("spawn")
+            self._manager = context.Manager()
+            self._shared = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+    def submit(self, data, **kwargs):
+        """Lägger ett PDF-jobb i kön och returnerar dess id"""
+        # Bilder skickas helst som blob-referenser; buffrar görs om till bytes för överföringen
+        if hasattr(kwargs.get("fyrfalt_image"), "getvalue"):
+            kwargs["fyrfalt_image"] = kwargs["fyrfalt_image"].getvalue()
+        kwargs["data"] = data
+
+        self.sweep()
+        with self._lock:
+            self._ensure_started()
+            job_id = uuid.uuid4().hex
+            self._shared[job_id] = {"section": None, "done": 0, "total": len(PDF_SECTIONS)}
+            future = self._executor.submit(_run_pdf_job, job_id, self._shared, kwargs)
+            self._jobs[job_id] = future
+        future.add_done_callback(lambda _, job_id=job_id: self._mark_finished(job_id))
+        return job_id
+
+    def _mark_finished(self, job_id):
+        with self._lock:
+            if job_id in self._jobs:
+                self._finished_at[job_id] = time.monotonic()
+
+    def status(self, job_id):
+        """
+        Returnerar jobbets status som en dict med state (pending, running, done,
+        failed, cancelled eller unknown), section, done, total och error.
+        """
+        future = self._jobs.get(job_id)
+        if future is None:
+            return {"state": "unknown"}
+
+        progress = dict(self._shared.get(job_id) or {})
+        if future.cancelled():
+            return {"state": "cancelled", **progress}
+        if not future.done():
+            return {"state": "running" if future.running() else "pending", **progress}
+
+        error = future.exception()
+        if isinstance(error, PdfCancelled):
+            return {"state": "cancelled", **progress}
+        if error is not None:
+            return {"state": "failed", "error": str(error), **progress}
+        return {"state": "done", **progress}
+
+    def result(self, job_id, timeout=None):
+        """Returnerar PDF-bytes för ett klart jobb och glömmer sedan jobbet"""
+        future = self._jobs[job_id]
+        try:
+            return future.result(timeout=timeout)
+        finally:
+            if future.done():
+                self.forget(job_id)
+
+    def cancel(self, job_id):
+        """Avbryter ett jobb; ett jobb som redan körs stoppas vid nästa sektion"""
+        future = self._jobs.get(job_id)
+        if future is None:
+            return False
+        if future.cancel():
+            return True
+        self._shared[f"{job_id}:cancel"] = True
+        return not future.done()
+
+    def forget(self, job_id):
+        """
+        Tar bort jobbets bokföring. Körs jobbet fortfarande tas den delade
+        statusen bort först när det har avslutats, så att en begärd
+        avbrytning hinner nå arbetsprocessen.
+        """
+        with self._lock:
+            future = self._jobs.pop(job_id, None)
+            self._finished_at.pop(job_id, None)
+        if future is not None and not future.done():
+            future.add_done_callback(lambda _: self._drop_shared(job_id))
+        else:
+            self._drop_shared(job_id)
+
+    def _drop_shared(self, job_id):
+        if self._shared is not None:
+            self._shared.pop(job_id, None)
+            self._shared.pop(f"{job_id}:cancel", None)
+
+    def sweep(self, ttl=PDF_JOB_TTL):
+        """Glömmer jobb som avslutades för mer än ttl sekunder sedan utan att hämtas"""
+        cutoff = time.monotonic() - ttl
+        expired = [job_id for job_id, finished in list(self._finished_at.items()) if finished < cutoff]
+        for job_id in expired:
+            self.forget(job_id)
+        return len(expired)
+
+
+# Delad jobbhanterare för hela processen
+pdf_jobs = PdfJobManager()
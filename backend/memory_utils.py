@@ -0,0 +1,132 @@
+# backend/memory_utils.py
+# Tokenmedvetet samtalsminne för frågesektionen
+
+import os
+
+from backend.openai_utils import generate_chat_response
+
+# Max antal tokens för historik + sammanfattning som skickas med varje fråga
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "2000"))
+
+# Modell och längd för den rullande sammanfattningen
+SUMMARY_MODEL = os.getenv("CONVERSATION_SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = 300
+
+# Ungefärlig overhead per meddelande i chattformatet
+TOKENS_PER_MESSAGE = 4
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text):
+    """Räknar tokens i en text, med tiktoken om det finns installerat"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # Grov uppskattning: ca 4 tecken per token
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(messages):
+    """Räknar tokens i en lista av chattmeddelanden"""
+    return sum(count_tokens(m.get("content", "")) + TOKENS_PER_MESSAGE for m in messages)
+
+
+def summarize_turns(summary, turns):
+    """
+    Bakar in äldre samtalsturer i den rullande sammanfattningen. Kastar ett
+    undantag om sammanfattningen inte kunde skapas.
+    """
+    transcript = "\n".join(
+        f"{'Användaren' if t['role'] == 'user' else 'Ulrika'}: {t['content']}" for t in turns
+    )
+    messages = [
+        {"role": "system", "content": "Du sammanfattar samtal mellan en användare och hälsokocken Ulrika Davidsson. Behåll användarens frågor, personliga detaljer och de viktigaste råden. Skriv kortfattat på svenska."},
+        {"role": "user", "content": f"Tidigare sammanfattning:\n{summary or '(ingen)'}\n\nNya samtalsturer:\n{transcript}\n\nSkriv en uppdaterad sammanfattning."}
+    ]
+    new_summary = generate_chat_response(
+        messages, model=SUMMARY_MODEL, temperature=0.3, max_tokens=SUMMARY_MAX_TOKENS, raise_errors=True
+    )
+    if not new_summary:
+        raise ValueError("Sammanfattningen blev tom")
+    return new_summary
+
+
+def turns_to_summarize(history, summary, token_budget=CONVERSATION_TOKEN_BUDGET):
+    """
+    Antal av de äldsta turerna som ska bakas in i sammanfattningen för att
+    historiken ska hålla sig inom tokenbudgeten, 0 om den redan gör det
+    """
+    if count_message_tokens(build_memory_messages(history, summary)) <= token_budget:
+        return 0
+
+    # Lämna hälften av budgeten åt sammanfattningen och flytta äldsta turerna dit
+    recent_budget = token_budget // 2
+    remaining = list(history)
+    count = 0
+    while remaining and (count_message_tokens(remaining) > recent_budget or len(remaining) % 2):
+        remaining.pop(0)
+        count += 1
+        if len(remaining) <= 2:
+            break
+    return count
+
+
+def start_compaction(history, summary, token_budget=CONVERSATION_TOKEN_BUDGET):
+    """
+    Startar sammanfattningen av de äldsta turerna i den delade bakgrundspoolen,
+    så att den inte fördröjer nästa svar.
+
+    Returns:
+        dict: Jobbet att ge till apply_compaction, eller None om historiken
+        redan ryms i budgeten
+    """
+    count = turns_to_summarize(history, summary, token_budget)
+    if not count:
+        return None
+    from backend.prefetch_utils import submit_background
+
+    turns = list(history[:count])
+    return {
+        "future": submit_background(summarize_turns, summary, turns),
+        "turns": turns,
+        "summary": summary,
+    }
+
+
+def apply_compaction(job, history, summary):
+    """
+    Byter in sammanfattningen från ett avslutat bakgrundsjobb.
+
+    Returns:
+        tuple: (history, summary, finished). Turerna släpps bara när en riktig
+        sammanfattning har kommit tillbaka och historiken fortfarande börjar
+        med de sammanfattade turerna; annars returneras allt oförändrat.
+    """
+    if not job["future"].done():
+        return history, summary, False
+    try:
+        new_summary = job["future"].result()
+    except Exception as e:
+        print(f"Kunde inte sammanfatta samtalet, behåller hela historiken: {e}")
+        return history, summary, True
+
+    count = len(job["turns"])
+    if summary != job["summary"] or history[:count] != job["turns"]:
+        # Samtalet har återställts eller ersatts sedan jobbet startade
+        return history, summary, True
+    return history[count:], new_summary, True
+
+
+def build_memory_messages(history, summary):
+    """Bygger historikmeddelanden med sammanfattningen först"""
+    messages = []
+    if summary:
+        messages.append({"role": "system", "content": f"Sammanfattning av tidigare samtal: {summary}"})
+    messages.extend(history)
+    return messages
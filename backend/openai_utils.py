@@ -2,49 +2,143 @@
 
 import os
 import json
-import requests
-import openai
+import time
 from dotenv import load_dotenv
-from openai import OpenAI
 import streamlit as st
-import io
-import matplotlib.pyplot as plt
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from backend.analysis_utils import (
+    QuadrantAnalysis,
+    LONGEVITY_SECTIONS,
+    SWOT_SECTIONS,
+    LONGEVITY_SECTION_KEYWORDS,
+    SWOT_SECTION_KEYWORDS,
+    build_response_format,
+    parse_structured_response
+)
+from backend.cache_utils import response_cache, make_cache_key
+from backend.diagram_utils import parse_quadrant_sections, create_swot_diagram, create_longevity_diagram
+from backend.http_utils import get_openai_http_client, http_get, OPENAI_BASE_URL
+from backend.prompt_utils import SYSTEM_PROMPT, build_task_prompt, prompt_cache_stats
+from backend.telemetry import track_call
 
 # Ladda miljövariabler från .env-filen
 load_dotenv()
 
-# Ställ in OpenAI API-nyckel från miljövariabel
-openai.api_key = os.getenv("OPENAI_API_KEY")
+@st.cache_resource(show_spinner=False)
+def get_openai_client():
+    """
+    Returnerar den delade OpenAI-klienten. openai-paketet tar lång tid att
+    importera, så det laddas först vid första anropet i stället för när
+    sidorna importeras, och klienten skapas en gång för alla sessioner.
+    """
+    from openai import OpenAI
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY", None),
+        base_url=OPENAI_BASE_URL,
+        http_client=get_openai_http_client()
+    )
 
-# Skapa OpenAI-klienten
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", None))
+# Strukturerade analyser består av korta punkter och behöver färre tokens
+STRUCTURED_MAX_TOKENS = 600
 
-def generate_chat_response(messages, model="gpt-4o", temperature=0.7, max_tokens=1000):
+def generate_chat_response(messages, model="gpt-4o", temperature=0.7, max_tokens=1000, use_cache=True, response_format=None, feature=None, raise_errors=False):
     """
     Anropar OpenAI ChatCompletion och returnerar svar som en sträng.
+    Identiska anrop besvaras från svarscachen om inte use_cache=False.
+    Med response_format kan ett JSON-schema för svaret anges.
+    feature anger vilken funktion i appen anropet hör till i telemetrin;
+    utan den används namnet på den anropande funktionen.
+    Med raise_errors=True kastas fel vidare i stället för att returneras
+    som ett felmeddelande i svaret.
     """
+    cache_key = make_cache_key(model, messages, temperature, max_tokens, response_format)
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            with track_call("chat", model, feature) as call:
+                call.outcome = "cache_hit"
+            return cached
+    
+    extra_args = {}
+    if response_format is not None:
+        extra_args["response_format"] = response_format
+    
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        return response.choices[0].message.content
+        with track_call("chat", model, feature) as call:
+            response = get_openai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **extra_args
+            )
+            # Utan strömning kommer hela svaret på en gång, så första byte är hela svarstiden
+            call.first_byte()
+            call.set_usage(response.usage)
+            prompt_cache_stats.record(model, response.usage, call.ttfb_s)
+        content = response.choices[0].message.content
+        if use_cache and content:
+            response_cache.set(cache_key, content)
+        return content
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"Ett fel uppstod i GPT-anropet: {e}")
         return f"Kunde inte generera svar p.g.a. fel: {e}"
 
-def generate_chatgpt_response(prompt, history=None, temperature=0.7):
+def generate_chat_response_stream(messages, model="gpt-4o", temperature=0.7, max_tokens=1000, use_cache=True, feature="stream"):
     """
-    Anropar OpenAI ChatCompletion och returnerar ChatGPT:s svar som en sträng.
+    Anropar OpenAI ChatCompletion i strömmande läge och yieldar textbitar
+    (deltas) allteftersom de kommer in. Ett cachat svar yieldas i en bit.
+    """
+    cache_key = make_cache_key(model, messages, temperature, max_tokens)
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            with track_call("chat", model, feature, stream=True) as call:
+                call.outcome = "cache_hit"
+            yield cached
+            return
+    
+    try:
+        parts = []
+        with track_call("chat", model, feature, stream=True) as call:
+            stream = get_openai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                # Sista biten innehåller då tokenanvändningen, inklusive cachade prompttokens
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    call.set_usage(chunk.usage)
+                    prompt_cache_stats.record(model, chunk.usage, time.perf_counter() - call.start)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    call.first_byte()
+                    parts.append(delta)
+                    yield delta
+        if use_cache and parts:
+            response_cache.set(cache_key, "".join(parts))
+    except Exception as e:
+        st.error(f"Ett fel uppstod i GPT-anropet: {e}")
+        yield f"Kunde inte generera svar p.g.a. fel: {e}"
+
+def build_chatgpt_messages(prompt, history=None):
+    """
+    Bygger meddelandelistan med Ulrikas systemprompt, historik och aktuell fråga.
+    Systemprompten är densamma för alla anrop så att den kan cachas av API:t.
     """
     if history is None:
         history = []
     
     messages = [
-        {"role": "system", "content": "Du är Ulrika Davidsson, en känd svensk hälsokock och expert på functional food och longevity. Du är inspirerande, kunnig om näringslära och ger personliga råd om hälsosam kost för att förlänga livet och öka välbefinnandet. Använd aktuella forskning om longevity, blå zoner och functional food när du ger råd. Var personlig och hänvisa till din egen erfarenhet som hälsokock."}
+        {"role": "system", "content": SYSTEM_PROMPT}
     ]
     
     # Lägg till konversationshistorik
@@ -53,7 +147,25 @@ def generate_chatgpt_response(prompt, history=None, temperature=0.7):
     # Lägg till aktuell fråga
     messages.append({"role": "user", "content": prompt})
     
-    return generate_chat_response(messages, temperature=temperature)
+    return messages
+
+def generate_chatgpt_response(prompt, history=None, temperature=0.7, use_cache=True, response_format=None, max_tokens=1000, feature=None):
+    """
+    Anropar OpenAI ChatCompletion och returnerar ChatGPT:s svar som en sträng.
+    Sätt use_cache=False för att alltid få ett nytt, kreativt svar.
+    """
+    messages = build_chatgpt_messages(prompt, history)
+    return generate_chat_response(
+        messages, temperature=temperature, max_tokens=max_tokens,
+        use_cache=use_cache, response_format=response_format, feature=feature
+    )
+
+def generate_chatgpt_response_stream(prompt, history=None, temperature=0.7, use_cache=True, feature="stream"):
+    """
+    Strömmande variant av generate_chatgpt_response som yieldar textbitar.
+    """
+    messages = build_chatgpt_messages(prompt, history)
+    yield from generate_chat_response_stream(messages, temperature=temperature, use_cache=use_cache, feature=feature)
 
 def search_web(query):
     """
@@ -62,7 +174,11 @@ def search_web(query):
     try:
         search_term = f"{query} site:.se"
         url = f"https://api.duckduckgo.com/?q={search_term}&format=json"
-        response = requests.get(url)
+        with track_call("search", "duckduckgo") as call:
+            response = http_get(url)
+            call.first_byte(response.elapsed.total_seconds())
+            if response.status_code != 200:
+                call.outcome = f"http_{response.status_code}"
         if response.status_code == 200:
             return response.json()
         else:
@@ -75,12 +191,13 @@ def generate_logo(business_name, business_type):
     try:
         prompt = f"Skapa en minimalistisk, modern logotyp för ett företag som heter '{business_name}' som säljer {business_type}. Använd enkla former och max 3 färger. Gör den i vektorstil med transparent bakgrund. Logotypen ska vara professionell och lätt att känna igen."
         
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            n=1,
-            size="1024x1024"
-        )
+        with track_call("image", "dall-e-3", quality="standard"):
+            response = get_openai_client().images.generate(
+                model="dall-e-3",
+                prompt=prompt,
+                n=1,
+                size="1024x1024"
+            )
         
         # Returnera URL till bilden
         return response.data[0].url
@@ -106,96 +223,37 @@ def generate_swot_analysis(data):
     swot_text = generate_chatgpt_response(prompt)
     return swot_text
 
-def create_swot_diagram(swot_text):
-    """Skapar en visuell SWOT-diagram från text"""
-    # Extrahera sektioner från SWOT-texten
-    sections = {}
-    current_section = None
-    current_content = []
-    
-    for line in swot_text.split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-            
-        if any(keyword in line.lower() for keyword in ['styrkor', 'strength']):
-            current_section = 'Styrkor'
-            current_content = []
-        elif any(keyword in line.lower() for keyword in ['svagheter', 'weakness']):
-            if current_section and current_content:
-                sections[current_section] = current_content
-            current_section = 'Svagheter'
-            current_content = []
-        elif any(keyword in line.lower() for keyword in ['möjligheter', 'opportunit']):
-            if current_section and current_content:
-                sections[current_section] = current_content
-            current_section = 'Möjligheter'
-            current_content = []
-        elif any(keyword in line.lower() for keyword in ['hot', 'threat']):
-            if current_section and current_content:
-                sections[current_section] = current_content
-            current_section = 'Hot'
-            current_content = []
-        elif current_section and line.startswith(('•', '-', '*', '1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.')):
-            # Rensa bort punktlistetecken
-            item = line.lstrip('•-*123456789. ')
-            current_content.append(item)
-    
-    # Lägg till den sista sektionen
-    if current_section and current_content:
-        sections[current_section] = current_content
-    
-    # Skapa en figur med 2x2 rutnät
-    fig, axs = plt.subplots(2, 2, figsize=(12, 10))
-    fig.patch.set_facecolor('#f0f0f0')
-    
-    # Definiera färger för varje sektion
-    colors = {
-        'Styrkor': '#4CAF50',      # Grön
-        'Svagheter': '#F44336',    # Röd
-        'Möjligheter': '#2196F3',  # Blå
-        'Hot': '#FF9800'           # Orange
-    }
-    
-    # Titlar och innehåll för varje kvadrant
-    sections_order = ['Styrkor', 'Svagheter', 'Möjligheter', 'Hot']
-    positions = [(0, 0), (0, 1), (1, 0), (1, 1)]
-    
-    for (section, pos) in zip(sections_order, positions):
-        i, j = pos
-        ax = axs[i, j]
-        
-        # Sätt bakgrundsfärg
-        ax.set_facecolor(colors.get(section, '#EEEEEE') + '22')  # Lägg till transparens
-        
-        # Sätt titel
-        ax.set_title(section, fontsize=14, fontweight='bold', color=colors.get(section, '#333333'))
-        
-        # Lägg till innehåll
-        content = sections.get(section, ['Ingen information tillgänglig'])
-        y_pos = 0.9
-        for item in content[:7]:  # Begränsa till max 7 punkter
-            if len(item) > 60:
-                item = item[:57] + '...'  # Begränsa textlängd för visning
-            ax.text(0.1, y_pos, f"• {item}", fontsize=10, va='top', wrap=True)
-            y_pos -= 0.12
-        
-        # Ta bort axlar
-        ax.set_xticks([])
-        ax.set_yticks([])
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.spines['bottom'].set_visible(False)
-        ax.spines['left'].set_visible(False)
-    
-    plt.tight_layout()
+def generate_swot_analysis_structured(data):
+    """Genererar en SWOT-analys som en QuadrantAnalysis via JSON-schema"""
+    prompt = f"""
+    Gör en SWOT-analys för ett företag som säljer {data.get('produktutbud', 'produkter')} 
+    i {data.get('stad', 'en stad')} med målgruppen {data.get('malgrupp', 'konsumenter')} 
+    och en {data.get('strategi', 'ospecificerad')}-strategi.
     
-    # Spara figuren till en buffer
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150)
-    buf.seek(0)
+    Ge 5 korta punkter (högst 12 ord vardera) för varje kategori: styrkor, svagheter, möjligheter och hot.
+    Lämna text som null om ingen längre kommentar behövs.
     
-    return buf
+    Basera analysen på konkret marknadsinformation och branschinsikter.
+    """
+    return _generate_structured_analysis(prompt, "swot_analys", SWOT_SECTIONS, SWOT_SECTION_KEYWORDS)
+
+def _generate_structured_analysis(prompt, schema_name, section_spec, section_keywords):
+    """
+    Kör en fyrfältsprompt med strikt JSON-schema. Om svaret inte går att läsa
+    som JSON tolkas det som fri text så att anroparen alltid får ett resultat.
+    """
+    content = generate_chatgpt_response(
+        prompt,
+        response_format=build_response_format(schema_name, section_spec),
+        max_tokens=STRUCTURED_MAX_TOKENS
+    )
+    analysis = parse_structured_response(content, section_spec)
+    if analysis is None:
+        analysis = QuadrantAnalysis(
+            sections=parse_quadrant_sections(content or "", section_keywords),
+            text=content
+        )
+    return analysis
 
 def generate_company_manifest(data):
     """Genererar ett företagsmanifest"""
@@ -221,12 +279,13 @@ def generate_food_vision(name, goal):
     try:
         prompt = f"Skapa en vacker, inspirerande bild som representerar hälsosam mat och livsstil för {name} som vill {goal}. Inkludera färgglada, naturliga ingredienser som symboliserar hälsa och vitalitet. Gör bilden ljus, positiv och motiverande - en perfekt målbild för en hälsosam livsstil."
         
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            n=1,
-            size="1024x1024"
-        )
+        with track_call("image", "dall-e-3", quality="standard"):
+            response = get_openai_client().images.generate(
+                model="dall-e-3",
+                prompt=prompt,
+                n=1,
+                size="1024x1024"
+            )
         
         # Returnera URL till bilden
         return response.data[0].url
@@ -262,137 +321,72 @@ def create_food_diagram(food_text):
 
 def generate_longevity_analysis(data):
     """Genererar en longevitetsanalys baserat på användardata"""
-    prompt = f"""
-    Skapa en detaljerad "fyrfältare" för {data.get('namn', 'en person')} som har följande livsvanor:
-    Ålder: {data.get('alder', 'N/A')}
-    Aktivitetsnivå: {data.get('aktivitet', 'N/A')}
-    Stressnivå: {data.get('stress', 'N/A')}
-    Sömn: {data.get('somn', 'N/A')} timmar/natt
-    Kosthållning: {data.get('kosthallning', 'N/A')}
-    Superfoods som äts regelbundet: {', '.join(data.get('superfoods', ['Inga angivna']))}
-    Hälsoutmaningar: {', '.join(data.get('halsoutmaningar', ['Inga angivna']))}
-    
-    Ge minst 4 punkter för varje kategori:
-    1. Styrkefaktorer (befintliga vanor som främjar långt liv)
-    2. Utmaningar (vanor som kan minska livslängden)
-    3. Möjligheter (functional food och vanor att införa)
-    4. Livsvisdom (djupare insikter om mat, hälsa och longevity)
-    
-    Basera analysen på forskning om blå zoner, longevity och functional food kopplat till den information som personen delat.
-    """
-    
-    longevity_text = generate_chatgpt_response(prompt)
+    longevity_text = generate_chatgpt_response(build_task_prompt("fyrfaltsanalys", data))
     return longevity_text
 
-def create_longevity_diagram(longevity_text):
-    """Skapar en visuell fyrfältare från text om longevity"""
-    # Extrahera sektioner från texten
-    sections = {}
-    current_section = None
-    current_content = []
-    
-    # Ändrade sektionsnamn jämfört med SWOT
-    for line in longevity_text.split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-            
-        if any(keyword in line.lower() for keyword in ['styrk', 'befintliga']):
-            current_section = 'Styrkefaktorer'
-            current_content = []
-        elif any(keyword in line.lower() for keyword in ['utmaning', 'minska']):
-            if current_section and current_content:
-                sections[current_section] = current_content
-            current_section = 'Utmaningar'
-            current_content = []
-        elif any(keyword in line.lower() for keyword in ['möjlighet', 'införa']):
-            if current_section and current_content:
-                sections[current_section] = current_content
-            current_section = 'Möjligheter'
-            current_content = []
-        elif any(keyword in line.lower() for keyword in ['visdom', 'insikt']):
-            if current_section and current_content:
-                sections[current_section] = current_content
-            current_section = 'Livsvisdom'
-            current_content = []
-        elif current_section and line.startswith(('•', '-', '*', '1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.')):
-            # Rensa bort punktlistetecken
-            item = line.lstrip('•-*123456789. ')
-            current_content.append(item)
-    
-    # Lägg till den sista sektionen
-    if current_section and current_content:
-        sections[current_section] = current_content
-    
-    # Skapa en figur med 2x2 rutnät - resten av funktionen är samma som SWOT-diagramfunktionen men med uppdaterade färger
-    import matplotlib.pyplot as plt
-    import io
-    
-    fig, axs = plt.subplots(2, 2, figsize=(12, 10))
-    fig.patch.set_facecolor('#f0f0f0')
-    
-    # Definiera färger för varje sektion - anpassade till longevity-tema
-    colors = {
-        'Styrkefaktorer': '#388E3C',   # Mörkgrön
-        'Utmaningar': '#F57C00',       # Orange
-        'Möjligheter': '#1976D2',      # Blå
-        'Livsvisdom': '#7B1FA2'        # Lila
-    }
-    
-    # Titlar och innehåll för varje kvadrant
-    sections_order = ['Styrkefaktorer', 'Utmaningar', 'Möjligheter', 'Livsvisdom']
-    positions = [(0, 0), (0, 1), (1, 0), (1, 1)]
-    
-    for (section, pos) in zip(sections_order, positions):
-        i, j = pos
-        ax = axs[i, j]
-        
-        # Sätt bakgrundsfärg
-        ax.set_facecolor(colors.get(section, '#EEEEEE') + '22')  # Lägg till transparens
-        
-        # Sätt titel
-        ax.set_title(section, fontsize=14, fontweight='bold', color=colors.get(section, '#333333'))
-        
-        # Lägg till innehåll
-        content = sections.get(section, ['Ingen information tillgänglig'])
-        y_pos = 0.9
-        for item in content[:7]:  # Begränsa till max 7 punkter
-            if len(item) > 60:
-                item = item[:57] + '...'  # Begränsa textlängd för visning
-            ax.text(0.1, y_pos, f"• {item}", fontsize=10, va='top', wrap=True)
-            y_pos -= 0.12
-        
-        # Ta bort axlar
-        ax.set_xticks([])
-        ax.set_yticks([])
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.spines['bottom'].set_visible(False)
-        ax.spines['left'].set_visible(False)
-    
-    plt.tight_layout()
-    
-    # Spara figuren till en buffer
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150)
-    buf.seek(0)
-    
-    return buf
+def generate_longevity_analysis_structured(data):
+    """Genererar en longevitetsanalys som en QuadrantAnalysis via JSON-schema"""
+    prompt = build_task_prompt("fyrfaltsanalys_strukturerad", data)
+    return _generate_structured_analysis(prompt, "longevity_analys", LONGEVITY_SECTIONS, LONGEVITY_SECTION_KEYWORDS)
 
 def generate_life_motto(data):
     """Genererar ett personligt livsmotto"""
-    prompt = f"""
-    Skapa ett inspirerande och kraftfullt personligt livsmotto för {data.get('namn', 'en person')} 
-    som fokuserar på longevity, hälsosam livsstil och functional food.
-    
-    Personen har följande egenskaper:
-    Ålder: {data.get('alder', 'N/A')}
-    Hälsomål: {data.get('halsomal', 'bli hälsosammare')}
-    Kosthållning: {data.get('kosthallning', 'blandkost')}
+    motto = generate_chatgpt_response(build_task_prompt("livsmotto", data))
+    return motto
+
+def generate_longevity_factors(data):
+    """Analyserar de faktorer som påverkar personens potentiella livslängd"""
+    return generate_chatgpt_response(build_task_prompt("longevity_faktorer", data))
+
+def build_kursplan_prompt(data):
+    """Prompten för den personliga kursplanen"""
+    return build_task_prompt("kursplan", data)
+
+def build_question_prompt(question):
+    """Prompten för en fråga till Ulrika; historiken skickas separat"""
+    return build_task_prompt("fraga", question=question)
+
+def generate_all_longevity(data, on_result=None, prefetcher=None):
+    """
+    Kör de oberoende longevity-anropen parallellt i en trådpool och ritar
+    fyrfältsdiagrammet så fort analysen är klar.
     
-    Motton ska vara personligt, inspirerande och reflektera Ulrika Davidssons filosofi om att mat är medicin. 
-    Avsluta med en kort reflektion om hur detta motto kan guida personen i vardagen.
+    Args:
+        data (dict): Användarens data
+        on_result (callable): Anropas med (nyckel, värde) när varje del är klar
+        prefetcher: Valfri SpeculativePrefetcher vars förberäknade resultat används
+        
+    Returns:
+        dict: fyrfalt_analys, fyrfalt_image, livsmotto och longevity_faktorer
     """
+    tasks = {
+        "fyrfalt_analys": generate_longevity_analysis_structured,
+        "livsmotto": generate_life_motto,
+        "longevity_faktorer": generate_longevity_factors,
+    }
+    results = {}
+    
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        if prefetcher is not None:
+            futures = {
+                executor.submit(prefetcher.get_or_run, key, func, data): key
+                for key, func in tasks.items()
+            }
+        else:
+            futures = {executor.submit(func, data): key for key, func in tasks.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = f"Kunde inte generera svar p.g.a. fel: {e}"
+            if on_result:
+                on_result(key, results[key])
+            
+            # Diagrammet ritas i anropande tråd medan övriga anrop fortsätter
+            if key == "fyrfalt_analys":
+                results["fyrfalt_image"] = create_longevity_diagram(results[key])
+                if on_result:
+                    on_result("fyrfalt_image", results["fyrfalt_image"])
     
-    motto = generate_chatgpt_response(prompt)
-    return motto
+    return results
@@ -1,35 +1,55 @@
 # backend/pdf_utils.py
 
-import tempfile
-import os
-import base64
+import json
+import hashlib
 from fpdf import FPDF
 from datetime import datetime
-import requests
-import uuid
-import io
-from PIL import Image
+from backend.asset_utils import (
+    ULRIKA_IMAGE_PATH,
+    load_static_image,
+    load_image_asset,
+    place_image
+)
 
-def create_pdf_report(data, fyrfalt_text=None, fyrfalt_image=None, livsmotto=None, vision_image=None, full_analysis=False):
-    """Skapar en PDF-rapport med all hälsoinformation"""
+# Rapportens sektioner i den ordning de byggs, används för förloppsrapportering
+PDF_SECTIONS = ["forsida", "halsoprofil", "analys", "kursplan", "fyrfalt", "livsmotto", "avslutning"]
+
+class PdfCancelled(Exception):
+    """Kastas av en progress-callback för att avbryta bygget av en rapport"""
+
+def create_pdf_report(data, fyrfalt_text=None, fyrfalt_image=None, livsmotto=None, vision_image=None, full_analysis=False, output=None, progress=None):
+    """
+    Skapar en PDF-rapport med all hälsoinformation helt i minnet.
+    
+    progress anropas med sektionsnamnet (se PDF_SECTIONS) innan varje sektion
+    byggs och kan kasta PdfCancelled för att avbryta.
+    
+    Returns:
+        bytes: PDF-datan, eller output om en buffer skickades in (datan skrivs då dit)
+    """
+    def report(section):
+        if progress:
+            progress(section)
+    
     try:
+        report("forsida")
         pdf = FPDF()
         # Sätt UTF-8 som kodning för att hantera specialtecken
         pdf.add_page()
         
         # Försök lägga till Ulrikas bild som vattenmärke om den finns
         try:
-            # Kontrollera sökvägen till bilden
-            ulrika_image_path = "bilder/u.jpg"
-            if os.path.exists(ulrika_image_path):
+            # Bilden avkodas och skalas ned en gång per process
+            ulrika_image = load_static_image(ULRIKA_IMAGE_PATH)
+            if ulrika_image:
                 # Sätt bakgrundsfärg till vit
                 pdf.set_fill_color(255, 255, 255)
                 pdf.rect(0, 0, 210, 297, style="F")
                 
                 # Lägg till bild utan alpha-parameter
-                pdf.image(ulrika_image_path, x=110, y=10, w=80)
+                place_image(pdf, ulrika_image, x=110, y=10, w=80)
             else:
-                print(f"Varning: Kunde inte hitta bilden på {ulrika_image_path}")
+                print(f"Varning: Kunde inte hitta bilden på {ULRIKA_IMAGE_PATH}")
         except Exception as e:
             print(f"Kunde inte lägga till vattenmärke: {e}")
         
@@ -47,21 +67,14 @@ def create_pdf_report(data, fyrfalt_text=None, fyrfalt_image=None, livsmotto=Non
         # Målbild om tillgänglig
         if vision_image:
             try:
-                # Ladda ner målbild
-                response = requests.get(vision_image)
-                if response.status_code == 200:
-                    img_path = f"temp_vision_{uuid.uuid4()}.png"
-                    with open(img_path, 'wb') as f:
-                        f.write(response.content)
-                    
-                    # Lägg till målbilden i PDF
-                    pdf.image(img_path, x=65, y=60, w=80)
+                # Målbilden skickas normalt in som en blob-referens som sparades när den
+                # genererades; en URL (t.ex. från äldre sparade sessioner) laddas ner som reserv
+                vision_asset = load_image_asset(vision_image, "print")
+                
+                # Lägg till målbilden i PDF
+                if vision_asset:
+                    place_image(pdf, vision_asset, x=65, y=60, w=80)
                     pdf.ln(90)  # Lägg till utrymme efter bilden
-                    
-                    # Ta bort temp-filen
-                    os.remove(img_path)
-                else:
-                    print(f"Kunde inte ladda ner bilden, status kod: {response.status_code}")
             except Exception as e:
                 print(f"Kunde inte lägga till målbild: {e}")
         
@@ -72,6 +85,8 @@ def create_pdf_report(data, fyrfalt_text=None, fyrfalt_image=None, livsmotto=Non
 Med rätt kunskaper och verktyg kan du uppnå optimal hälsa och livslängd genom medvetna matval och livsstilsförändringar.""")
         pdf.ln(5)
         
+        report("halsoprofil")
+        
         # Grundläggande information
         pdf.set_font("Arial", "B", 16)
         pdf.cell(190, 10, "Din hälsoprofil", ln=True)
@@ -105,6 +120,8 @@ Med rätt kunskaper och verktyg kan du uppnå optimal hälsa och livslängd geno
         
         pdf.ln(10)
         
+        report("analys")
+        
         # Hela analysen om full_analysis=True och det finns superfoods data
         if full_analysis:
             pdf.set_font("Arial", "B", 16)
@@ -157,6 +174,8 @@ Dessa förbättringar är bara början på din resa mot optimal hälsa och välb
             pdf.multi_cell(190, 10, forbattringstext)
             pdf.ln(5)
         
+        report("kursplan")
+        
         # Kursplan
         if 'kursplan' in data:
             pdf.add_page()
@@ -184,6 +203,8 @@ Dessa förbättringar är bara början på din resa mot optimal hälsa och välb
                     pdf.multi_cell(190, 10, paragraph)
                     pdf.ln(5)
         
+        report("fyrfalt")
+        
         # Fyrfältsanalys
         if fyrfalt_text:
             pdf.add_page()
@@ -194,18 +215,17 @@ Dessa förbättringar är bara början på din resa mot optimal hälsa och välb
             # Om det finns en bild av fyrfältsdiagrammet
             if fyrfalt_image:
                 try:
-                    fyrfalt_img_path = f"temp_fyrfalt_{uuid.uuid4()}.png"
-                    with open(fyrfalt_img_path, 'wb') as f:
-                        f.write(fyrfalt_image.getvalue())
-                    
-                    pdf.image(fyrfalt_img_path, x=10, y=None, w=190)
-                    pdf.ln(140)  # Lägg till tillräckligt med utrymme efter bilden
-                    
-                    # Ta bort temp-filen
-                    os.remove(fyrfalt_img_path)
+                    fyrfalt_asset = load_image_asset(fyrfalt_image, "print_wide")
+                    if fyrfalt_asset:
+                        place_image(pdf, fyrfalt_asset, x=10, y=None, w=190)
+                        pdf.ln(140)  # Lägg till tillräckligt med utrymme efter bilden
                 except Exception as e:
                     print(f"Kunde inte lägga till fyrfältsbild: {e}")
             
+            # Strukturerade analyser skrivs ut sektion för sektion
+            if hasattr(fyrfalt_text, 'sections'):
+                fyrfalt_text = _format_quadrant_analysis(fyrfalt_text)
+            
             # Detaljerad fyrfältstext - Ersätt problematiska Unicode-tecken
             fyrfalt_text = fyrfalt_text.replace('•', '*')
             pdf.set_font("Arial", "", 12)
@@ -213,6 +233,8 @@ Dessa förbättringar är bara början på din resa mot optimal hälsa och välb
             fyrfalt_text_safe = fyrfalt_text.encode('latin-1', 'replace').decode('latin-1')
             pdf.multi_cell(190, 10, fyrfalt_text_safe)
         
+        report("livsmotto")
+        
         # Livsmotto (istället för företagsmanifest)
         if livsmotto:
             pdf.add_page()
@@ -227,12 +249,15 @@ Dessa förbättringar är bara början på din resa mot optimal hälsa och välb
             livsmotto_safe = livsmotto.encode('latin-1', 'replace').decode('latin-1')
             pdf.multi_cell(190, 10, livsmotto_safe)
         
+        report("avslutning")
+        
         # Säljande avslutning
         pdf.add_page()
         # Försök lägga till Ulrikas bild igen
         try:
-            if os.path.exists("bilder/u.jpg"):
-                pdf.image("bilder/u.jpg", x=75, y=40, w=60)
+            ulrika_image = load_static_image(ULRIKA_IMAGE_PATH)
+            if ulrika_image:
+                place_image(pdf, ulrika_image, x=75, y=40, w=60)
                 pdf.ln(70)
         except Exception as e:
             print(f"Kunde inte lägga till slutbild: {e}")
@@ -266,12 +291,15 @@ För att säkra din plats, besök www.ulrikadavidsson.se/longevity eller ring 07
         now = datetime.now().strftime("%Y-%m-%d")
         pdf.cell(0, 10, f"Genererad {now} | Functional Food & Longevity med Ulrika Davidsson", 0, 0, 'C')
         
-        # Spara PDF temporärt
-        temp_pdf_path = f"haelsoplan_{now.replace('-', '')}.pdf"
-        pdf.output(temp_pdf_path)
-        
-        return temp_pdf_path
+        # Bygg PDF:en i minnet i stället för att gå via en fil
+        pdf_bytes = _pdf_to_bytes(pdf)
+        if output is not None:
+            output.write(pdf_bytes)
+            return output
+        return pdf_bytes
         
+    except PdfCancelled:
+        raise
     except Exception as e:
         # Lägg till detaljerad felhantering
         import traceback
@@ -279,14 +307,56 @@ För att säkra din plats, besök www.ulrikadavidsson.se/longevity eller ring 07
         print(f"Detaljerat fel vid skapande av PDF: {error_details}")
         raise Exception(f"Kunde inte skapa PDF: {str(e)}")
 
-def get_pdf_download_link(file_path, text="Ladda ner PDF"):
-    """Genererar en länk för att ladda ner PDF-filen"""
-    with open(file_path, "rb") as f:
-        pdf_bytes = f.read()
-    
-    b64 = base64.b64encode(pdf_bytes).decode()
-    href = f'<a href="data:application/pdf;base64,{b64}" download="{os.path.basename(file_path)}">{text}</a>'
-    return href
+def _pdf_to_bytes(pdf):
+    """Returnerar PDF-datan som bytes (fpdf ger en latin-1-sträng, fpdf2 en bytearray)"""
+    out = pdf.output(dest='S')
+    if isinstance(out, str):
+        return out.encode('latin-1')
+    return bytes(out)
+
+def get_pdf_filename():
+    """Filnamn som erbjuds vid nedladdning av rapporten"""
+    return f"haelsoplan_{datetime.now().strftime('%Y%m%d')}.pdf"
+
+def pdf_content_version(data, fyrfalt_text=None, fyrfalt_image=None, livsmotto=None, vision_image=None, full_analysis=False):
+    """
+    Beräknar en hash av allt som påverkar rapportens innehåll, så att samma
+    version inte behöver byggas om vid varje omkörning. Bilder som ges som
+    blob-referenser eller URL:er hashas via referensen.
+    """
+    digest = hashlib.sha256()
+    if hasattr(fyrfalt_text, 'to_dict'):
+        fyrfalt_text = fyrfalt_text.to_dict()
+    payload = json.dumps(
+        {
+            "data": data,
+            "fyrfalt_text": fyrfalt_text,
+            "livsmotto": livsmotto,
+            "fyrfalt_image": fyrfalt_image if isinstance(fyrfalt_image, str) else None,
+            "vision_image": vision_image if isinstance(vision_image, str) else None,
+            "full_analysis": full_analysis,
+            "datum": datetime.now().strftime("%Y-%m-%d"),
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    digest.update(payload.encode("utf-8"))
+    for image in (fyrfalt_image, vision_image):
+        if image is not None and not isinstance(image, str):
+            digest.update(image.getvalue() if hasattr(image, 'getvalue') else bytes(image))
+    return digest.hexdigest()
+
+def _format_quadrant_analysis(analysis):
+    """Gör om en QuadrantAnalysis till ren text för PDF:en"""
+    parts = []
+    for name, items in analysis.sections.items():
+        parts.append(f"{name}:")
+        parts.extend(f"* {item}" for item in items)
+        parts.append("")
+    if analysis.text:
+        parts.append(analysis.text)
+    return "\n".join(parts).strip()
 
 def simple_pdf_report(title, content, output_filename="rapport.pdf"):
     """
@@ -0,0 +1,107 @@
+# backend/prefetch_utils.py
+
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.openai_utils import generate_longevity_analysis_structured, generate_life_motto
+
+# Fält som longevity-analysen och livsmottot bygger på
+PROFILE_FIELDS = [
+    'namn', 'alder', 'aktivitet', 'stress', 'somn',
+    'kosthallning', 'superfoods', 'halsoutmaningar', 'halsomal'
+]
+
+# Fält som måste vara ifyllda innan en spekulativ generering startas
+REQUIRED_FIELDS = ['alder', 'aktivitet', 'stress', 'somn', 'kosthallning']
+
+# Anrop som förberäknas i bakgrunden
+PREFETCH_TASKS = {
+    "fyrfalt_analys": generate_longevity_analysis_structured,
+    "livsmotto": generate_life_motto,
+}
+
+# Delad trådpool för alla sessioner så att antalet samtidiga anrop är begränsat
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+def submit_background(func, *args):
+    """Kör func(*args) i den delade trådpoolen och returnerar dess Future"""
+    return _executor.submit(func, *args)
+
+
+def profile_fingerprint(data):
+    """Skapar ett fingeravtryck av de profilfält som påverkar genereringen"""
+    profile = {field: data.get(field) for field in PROFILE_FIELDS}
+    payload = json.dumps(profile, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SpeculativePrefetcher:
+    """
+    Startar longevity-anropen i bakgrunden medan användaren fyller i formulären.
+
+    Resultaten nycklas på profilens fingeravtryck. Genereringen startar först när
+    samma fingeravtryck har setts vid två omkörningar i rad, dvs. när fälten har
+    slutat ändras. Ändras profilen kastas tidigare resultat som inaktuella.
+    """
+
+    def __init__(self, tasks=None, executor=None):
+        self.tasks = tasks or PREFETCH_TASKS
+        self.executor = executor or _executor
+        self._futures = {}
+        self._last_seen = None
+        self._lock = threading.Lock()
+
+    def observe(self, data):
+        """Anropas vid varje omkörning med aktuell användardata"""
+        if not all(data.get(field) for field in REQUIRED_FIELDS):
+            return
+
+        fingerprint = profile_fingerprint(data)
+        with self._lock:
+            if fingerprint != self._last_seen:
+                # Profilen har ändrats sedan förra omkörningen, vänta tills den är stabil
+                self._last_seen = fingerprint
+                self._discard_stale(fingerprint)
+                return
+
+            snapshot = dict(data)
+            for key, func in self.tasks.items():
+                entry = self._futures.get(key)
+                if entry and entry[0] == fingerprint:
+                    continue
+                self._futures[key] = (fingerprint, self.executor.submit(func, snapshot))
+
+    def _discard_stale(self, fingerprint):
+        """Kastar resultat som hör till ett annat fingeravtryck"""
+        for key in list(self._futures):
+            old_fingerprint, future = self._futures[key]
+            if old_fingerprint != fingerprint:
+                future.cancel()
+                del self._futures[key]
+
+    def get_or_run(self, key, func, data, timeout=None):
+        """
+        Returnerar det förberäknade resultatet för key om det matchar aktuell
+        profil (och väntar på det om anropet fortfarande pågår). Annars körs
+        func direkt.
+        """
+        fingerprint = profile_fingerprint(data)
+        with self._lock:
+            entry = self._futures.get(key)
+            if entry and entry[0] != fingerprint:
+                entry[1].cancel()
+                del self._futures[key]
+                entry = None
+
+        if entry:
+            try:
+                return entry[1].result(timeout=timeout)
+            except Exception as e:
+                print(f"Förberäknat anrop {key} misslyckades, kör om: {e}")
+                with self._lock:
+                    self._futures.pop(key, None)
+
+        return func(data)
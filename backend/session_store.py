@@ -0,0 +1,213 @@
+# backend/session_store.py
+# SQLite-baserad lagring av sessioner (ersätter tidsstämplade JSON-filer)
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    stage TEXT,
+    conversation_history TEXT NOT NULL DEFAULT '[]',
+    artifacts TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_fields (
+    session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (session_id, field)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sessions_name ON sessions(name);
+CREATE INDEX IF NOT EXISTS idx_sessions_stage ON sessions(stage);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at);
+"""
+
+
+def infer_stage(user_data):
+    """Bestämmer lämpligt steg baserat på vilken data som finns"""
+    if 'kursplan' in user_data:
+        return 'kursplan'
+    elif user_data.get('superfoods') or user_data.get('kosthallning'):
+        return 'longevity'
+    elif user_data.get('alder') and user_data.get('aktivitet'):
+        return 'matvanor'
+    elif user_data.get('namn'):
+        return 'livsstil'
+    else:
+        return 'intro'
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class SessionStore:
+    """
+    Sessioner lagras en rad per session, och varje fält i user_data som en
+    egen rad i session_fields så att enskilda fält kan uppdateras utan att
+    hela användardatan skrivs om. Databasen körs i WAL-läge så att läsare
+    inte blockeras av skrivningar.
+    """
+
+    def __init__(self, db_path=SESSION_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connect(self):
+        """Returnerar trådens egen anslutning"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def save_session(self, user_data, conversation_history=None, artifacts=None, session_id=None, stage=None):
+        """
+        Sparar en hel session. Utan session_id skapas en ny session.
+
+        Returns:
+            str: Sessionens id
+        """
+        session_id = session_id or uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO sessions (id, name, stage, conversation_history, artifacts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET name = excluded.name, stage = excluded.stage, "
+                "conversation_history = excluded.conversation_history, artifacts = excluded.artifacts, "
+                "updated_at = excluded.updated_at",
+                (
+                    session_id,
+                    user_data.get('namn'),
+                    stage or infer_stage(user_data),
+                    _dumps(conversation_history or []),
+                    _dumps(artifacts or {}),
+                    now,
+                    now,
+                ),
+            )
+            conn.execute("DELETE FROM session_fields WHERE session_id = ?", (session_id,))
+            conn.executemany(
+                "INSERT INTO session_fields (session_id, field, value) VALUES (?, ?, ?)",
+                [(session_id, key, _dumps(value)) for key, value in user_data.items()],
+            )
+        return session_id
+
+    def update_fields(self, session_id, **fields):
+        """Uppdaterar enskilda fält i user_data utan att skriva om resten"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO session_fields (session_id, field, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id, field) DO UPDATE SET value = excluded.value",
+                [(session_id, key, _dumps(value)) for key, value in fields.items()],
+            )
+            updates = ["updated_at = ?"]
+            params = [time.time()]
+            if 'namn' in fields:
+                updates.append("name = ?")
+                params.append(fields['namn'])
+            conn.execute(f"UPDATE sessions SET {', '.join(updates)} WHERE id = ?", (*params, session_id))
+
+    def update_session(self, session_id, stage=None, conversation_history=None, artifacts=None):
+        """Uppdaterar steg, konversationshistorik eller artefakter för en session"""
+        updates = ["updated_at = ?"]
+        params = [time.time()]
+        if stage is not None:
+            updates.append("stage = ?")
+            params.append(stage)
+        if conversation_history is not None:
+            updates.append("conversation_history = ?")
+            params.append(_dumps(conversation_history))
+        if artifacts is not None:
+            updates.append("artifacts = ?")
+            params.append(_dumps(artifacts))
+        conn = self._connect()
+        with conn:
+            conn.execute(f"UPDATE sessions SET {', '.join(updates)} WHERE id = ?", (*params, session_id))
+
+    def load_session(self, session_id):
+        """
+        Läser en session.
+
+        Returns:
+            dict: id, name, stage, user_data, conversation_history, artifacts,
+            created_at och updated_at, eller None om sessionen saknas
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT id, name, stage, conversation_history, artifacts, created_at, updated_at "
+            "FROM sessions WHERE id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        fields = conn.execute(
+            "SELECT field, value FROM session_fields WHERE session_id = ?", (session_id,)
+        ).fetchall()
+        return {
+            "id": row[0],
+            "name": row[1],
+            "stage": row[2],
+            "user_data": {field: json.loads(value) for field, value in fields},
+            "conversation_history": json.loads(row[3]),
+            "artifacts": json.loads(row[4]),
+            "created_at": row[5],
+            "updated_at": row[6],
+        }
+
+    def find_sessions(self, name=None, stage=None, limit=50):
+        """
+        Listar sessioner, senast uppdaterade först, filtrerat på namn och/eller
+        steg. limit=None ger alla.
+        """
+        clauses = []
+        params = []
+        if name is not None:
+            clauses.append("name = ?")
+            params.append(name)
+        if stage is not None:
+            clauses.append("stage = ?")
+            params.append(stage)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT id, name, stage, updated_at FROM sessions {where} ORDER BY updated_at DESC LIMIT ?",
+            (*params, -1 if limit is None else limit),
+        ).fetchall()
+        return [{"id": r[0], "name": r[1], "stage": r[2], "updated_at": r[3]} for r in rows]
+
+    def delete_session(self, session_id):
+        """Tar bort en session och dess fält"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Returnerar processens delade SessionStore"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+        return _store
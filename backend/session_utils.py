@@ -1,47 +1,206 @@
 # backend/session_utils.py
 
+import os
+import re
 import json
-from datetime import datetime
+import hashlib
 
-def save_progress(user_data, conversation_history):
+from backend.blob_store import get_blob_store
+from backend.session_store import get_session_store, infer_stage
+
+# Kakan som frontprocessen (server/proxy.py) ger varje webbläsare. Med den kan
+# framstegen återställas när webbläsaren hamnar på en annan Streamlit-process.
+SESSION_COOKIE = "app_session"
+_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# Genererade resultat som sparas bredvid user_data. Bilder och diagram ligger
+# redan i blob-lagret, som alla processer delar, och sparas som referenser.
+DURABLE_ARTIFACTS = (
+    "conversation_summary",
+    "fyrfalt_analys",
+    "fyrfalt_image",
+    "livsmotto",
+    "longevity_faktorer",
+    "vision_image",
+)
+
+def save_progress(user_data, conversation_history, artifacts=None, session_id=None):
     """
-    Sparar användardata och konversationshistorik till en fil
+    Sparar användardata och konversationshistorik i sessionslagret
     
     Args:
         user_data (dict): Användarens data och svar
         conversation_history (list): Historiken över konversationen
+        artifacts (dict): Valfria genererade texter, t.ex. fyrfalt_analys och livsmotto
+        session_id (str): Befintlig session att skriva över, annars skapas en ny
         
     Returns:
-        str: Filnamnet som skapades
+        str: Sessionens id
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"affarsplan_{timestamp}.json"
-    
-    data = {
-        "user_data": user_data,
-        "conversation_history": conversation_history,
-        "timestamp": timestamp
-    }
-    
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    
-    return filename
+    return get_session_store().save_session(
+        user_data,
+        conversation_history,
+        artifacts=artifacts,
+        session_id=session_id
+    )
 
-def load_progress(filename):
+def load_progress(session_id):
     """
-    Laddar användardata och konversationshistorik från en fil
+    Laddar användardata och konversationshistorik från sessionslagret
     
     Args:
-        filename (str): Sökvägen till filen som ska laddas
+        session_id (str): Sessionens id, eller sökvägen till en äldre JSON-fil
         
     Returns:
         tuple: (user_data, conversation_history)
     """
     try:
-        with open(filename, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        # Äldre sparade sessioner ligger som JSON-filer
+        if session_id.endswith(".json") and os.path.exists(session_id):
+            with open(session_id, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data.get("user_data", {}), data.get("conversation_history", [])
         
-        return data.get("user_data", {}), data.get("conversation_history", [])
+        session = get_session_store().load_session(session_id)
+        if session is None:
+            return {}, []
+        return session["user_data"], session["conversation_history"]
     except Exception as e:
-        return {}, [] 
\ No newline at end of file
+        return {}, []
+
+
+def valid_session_id(value):
+    """Sant om värdet ser ut som ett sessions-id från frontprocessen"""
+    return isinstance(value, str) and bool(_SESSION_ID.match(value))
+
+def durable_snapshot(state):
+    """
+    Den del av sessionen som ska överleva ett byte av Streamlit-process
+    
+    Args:
+        state: st.session_state eller en dict med samma nycklar
+        
+    Returns:
+        dict: user_data, conversation_history, artifacts och stage
+    """
+    artifacts = {}
+    for key in DURABLE_ARTIFACTS:
+        value = state.get(key)
+        if value is not None:
+            artifacts[key] = value.to_dict() if hasattr(value, "to_dict") else value
+    stored_pdf = state.get("_stored_pdf")
+    if stored_pdf:
+        artifacts["pdf"] = {"version": stored_pdf[0], "ref": stored_pdf[1]}
+    return {
+        "user_data": state.get("user_data", {}),
+        "conversation_history": state.get("conversation_history", []),
+        "artifacts": artifacts,
+        "stage": state.get("current_stage", "intro"),
+    }
+
+def _fingerprint(value):
+    data = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def _snapshot_digest(snapshot):
+    """Fingeravtryck per del av en ögonblicksbild, och per fält i user_data"""
+    return {
+        "fields": {key: _fingerprint(value) for key, value in snapshot["user_data"].items()},
+        "conversation_history": _fingerprint(snapshot["conversation_history"]),
+        "artifacts": _fingerprint(snapshot["artifacts"]),
+        "stage": snapshot["stage"],
+    }
+
+def persist_session_state(state, session_id):
+    """
+    Skriver sessionens varaktiga delar till sessionslagret om de har ändrats
+    sedan förra gången. Anropas i slutet av varje körning av appen.
+    
+    Bara ändrade fält i user_data och ändrade delar av sessionen skrivs. Hela
+    sessionen skrivs om första gången och när ett fält har tagits bort.
+    
+    Args:
+        state: st.session_state
+        session_id (str): Id från sessionskakan
+        
+    Returns:
+        bool: True om något skrevs
+    """
+    # PDF:en läggs i blob-lagret en gång per version, inte vid varje körning
+    if state.get("pdf_bytes") and state.get("pdf_version"):
+        stored_pdf = state.get("_stored_pdf")
+        if not stored_pdf or stored_pdf[0] != state["pdf_version"]:
+            state["_stored_pdf"] = (state["pdf_version"], get_blob_store().put(state["pdf_bytes"]))
+    elif not state.get("pdf_bytes"):
+        state["_stored_pdf"] = None
+    
+    snapshot = durable_snapshot(state)
+    digest = _snapshot_digest(snapshot)
+    previous = state.get("_persisted_digest")
+    if previous == digest:
+        return False
+    
+    store = get_session_store()
+    if previous is None or set(previous["fields"]) - set(digest["fields"]):
+        store.save_session(
+            snapshot["user_data"],
+            snapshot["conversation_history"],
+            artifacts=snapshot["artifacts"],
+            session_id=session_id,
+            stage=snapshot["stage"]
+        )
+    else:
+        changed_fields = {
+            key: snapshot["user_data"][key]
+            for key, value in digest["fields"].items()
+            if previous["fields"].get(key) != value
+        }
+        if changed_fields:
+            store.update_fields(session_id, **changed_fields)
+        changed = {
+            key: snapshot[key]
+            for key in ("stage", "conversation_history", "artifacts")
+            if previous[key] != digest[key]
+        }
+        if changed:
+            store.update_session(session_id, **changed)
+    state["_persisted_digest"] = digest
+    return True
+
+def restore_session_state(state, session_id):
+    """
+    Läser in en sparad session i en ny Streamlit-session, t.ex. efter att
+    processen som användaren var på har startats om
+    
+    Args:
+        state: st.session_state
+        session_id (str): Id från sessionskakan
+        
+    Returns:
+        bool: True om en sparad session fanns
+    """
+    session = get_session_store().load_session(session_id)
+    if session is None:
+        return False
+    
+    state["user_data"] = session["user_data"]
+    state["conversation_history"] = session["conversation_history"]
+    state["current_stage"] = session["stage"] or infer_stage(session["user_data"])
+    artifacts = session["artifacts"]
+    for key in DURABLE_ARTIFACTS:
+        if key in artifacts:
+            state[key] = artifacts[key]
+    if isinstance(state.get("fyrfalt_analys"), dict):
+        from backend.analysis_utils import QuadrantAnalysis
+        state["fyrfalt_analys"] = QuadrantAnalysis.from_dict(state["fyrfalt_analys"])
+    
+    # En PDF som har rensats ur blob-lagret skapas om när användaren ber om den
+    pdf = artifacts.get("pdf")
+    pdf_bytes = get_blob_store().get(pdf["ref"]) if pdf else None
+    if pdf_bytes:
+        state["pdf_bytes"] = pdf_bytes
+        state["pdf_version"] = pdf["version"]
+        state["_stored_pdf"] = (pdf["version"], pdf["ref"])
+    
+    state["_persisted_digest"] = _snapshot_digest(durable_snapshot(state))
+    return True
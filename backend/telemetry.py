@@ -0,0 +1,307 @@
+# backend/telemetry.py
+# Mätning av varje OpenAI-anrop och webbsökning: JSONL-logg och Prometheus-mätvärden
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TELEMETRY_LOG_PATH = os.getenv("TELEMETRY_LOG_PATH", os.path.join(".cache", "telemetry.jsonl"))
+TELEMETRY_LOG_MAX_BYTES = int(os.getenv("TELEMETRY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+TELEMETRY_LOG_BACKUPS = int(os.getenv("TELEMETRY_LOG_BACKUPS", "5"))
+# Port för /metrics; 0 stänger av endpointen
+TELEMETRY_METRICS_PORT = int(os.getenv("TELEMETRY_METRICS_PORT", "9464"))
+
+# Driftmeddelanden; anropsloggen skrivs med en egen logger (se _get_logger)
+log = logging.getLogger(__name__)
+
+# Histogramgränser i sekunder
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Ungefärliga priser i USD per miljon tokens: (prompt, cachad prompt, svar)
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+# Pris i USD per bild och kvalitet
+IMAGE_PRICES = {
+    ("dall-e-3", "standard"): 0.04,
+    ("dall-e-3", "hd"): 0.08,
+}
+
+# Funktioner som bara slår in andra anrop och därför inte räknas som anropare
+_WRAPPER_FUNCTIONS = {
+    "generate_chat_response", "generate_chat_response_stream",
+    "generate_chatgpt_response", "generate_chatgpt_response_stream",
+    "_generate_structured_analysis", "track_call", "__enter__", "__exit__",
+    "get_or_run", "run",
+}
+
+
+def estimate_cost(model, prompt_tokens=0, completion_tokens=0, cached_tokens=0, quality=None):
+    """Uppskattad kostnad i USD för ett anrop, 0.0 för okända modeller"""
+    if quality is not None:
+        return IMAGE_PRICES.get((model, quality), 0.0)
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    prompt_price, cached_price, completion_price = prices
+    return (
+        (prompt_tokens - cached_tokens) * prompt_price
+        + cached_tokens * cached_price
+        + completion_tokens * completion_price
+    ) / 1_000_000
+
+
+def _caller_name():
+    """Namnet på närmaste funktion utanför telemetri- och omslagsfunktionerna"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        name = frame.f_code.co_name
+        if name not in _WRAPPER_FUNCTIONS and not frame.f_code.co_filename.endswith("contextlib.py"):
+            return name
+        frame = frame.f_back
+    return "okand"
+
+
+class CallRecord:
+    """Mätningen av ett enskilt anrop; fylls i medan anropet pågår"""
+
+    def __init__(self, kind, model, feature, **attrs):
+        self.kind = kind
+        self.model = model
+        self.feature = feature
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.ttfb_s = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.outcome = "ok"
+        self.error = None
+
+    def first_byte(self, seconds=None):
+        """Markerar första byte; seconds anger tiden direkt om den redan är känd"""
+        if self.ttfb_s is None:
+            self.ttfb_s = seconds if seconds is not None else time.perf_counter() - self.start
+
+    def set_usage(self, usage):
+        """Läser in ett usage-objekt från OpenAI-svaret"""
+        if usage is None:
+            return
+        self.prompt_tokens = usage.prompt_tokens or 0
+        self.completion_tokens = usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_tokens = getattr(details, "cached_tokens", None) or 0
+
+    def fail(self, error):
+        self.outcome = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self, wall_s):
+        return {
+            "ts": time.time(),
+            "kind": self.kind,
+            "feature": self.feature,
+            "model": self.model,
+            "outcome": self.outcome,
+            "wall_s": round(wall_s, 4),
+            "ttfb_s": round(self.ttfb_s, 4) if self.ttfb_s is not None else None,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cost_usd": round(estimate_cost(
+                self.model, self.prompt_tokens, self.completion_tokens,
+                self.cached_tokens, self.attrs.get("quality"),
+            ), 6),
+            "error": self.error,
+            **self.attrs,
+        }
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Minimal samling histogram och räknare som kan skrivas som Prometheus-text"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self):
+        """Prometheus textformat 0.0.4"""
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {histogram.total}")
+                lines.append(f"{name}_sum{fmt(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{fmt(labels)} {histogram.total}")
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} counter")
+                    seen.add(name)
+                lines.append(f"{name}{fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Delat register för hela processen
+metrics = MetricsRegistry()
+
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def _get_logger():
+    """Logger som skriver en JSON-rad per anrop till en roterande fil"""
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            logger = logging.getLogger("telemetry")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            try:
+                os.makedirs(os.path.dirname(TELEMETRY_LOG_PATH) or ".", exist_ok=True)
+                handler = RotatingFileHandler(
+                    TELEMETRY_LOG_PATH,
+                    maxBytes=TELEMETRY_LOG_MAX_BYTES,
+                    backupCount=TELEMETRY_LOG_BACKUPS,
+                    encoding="utf-8",
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            except OSError as e:
+                print(f"Kunde inte öppna telemetriloggen, loggar inte anrop: {e}")
+                logger.addHandler(logging.NullHandler())
+            _logger = logger
+        return _logger
+
+
+def record_call(record, wall_s):
+    """Skriver ett avslutat anrop till loggen och mätvärdena"""
+    entry = record.to_dict(wall_s)
+    _get_logger().info(json.dumps(entry, ensure_ascii=False, default=str))
+
+    labels = {"kind": record.kind, "feature": record.feature, "model": record.model}
+    metrics.inc("llm_calls_total", {**labels, "outcome": record.outcome})
+    metrics.observe("llm_call_duration_seconds", {**labels, "outcome": record.outcome}, wall_s)
+    if record.ttfb_s is not None:
+        metrics.observe("llm_call_ttfb_seconds", labels, record.ttfb_s)
+    for token_type in ("prompt", "completion", "cached"):
+        count = entry[f"{token_type}_tokens"]
+        if count:
+            metrics.inc("llm_tokens_total", {**labels, "type": token_type}, count)
+    if entry["cost_usd"]:
+        metrics.inc("llm_cost_usd_total", labels, entry["cost_usd"])
+
+
+@contextmanager
+def track_call(kind, model, feature=None, **attrs):
+    """
+    Mäter ett anrop. Undantag registreras som outcome=error och kastas vidare.
+
+        with track_call("chat", model, feature="livsmotto") as call:
+            response = client.chat.completions.create(...)
+            call.set_usage(response.usage)
+    """
+    record = CallRecord(kind, model, feature or _caller_name(), **attrs)
+    try:
+        yield record
+    except GeneratorExit:
+        # En strömmande generator som inte lästes till slut
+        record.outcome = "cancelled"
+        raise
+    except BaseException as e:
+        record.fail(e)
+        raise
+    finally:
+        try:
+            record_call(record, time.perf_counter() - record.start)
+        except Exception as e:
+            print(f"Kunde inte registrera telemetri: {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_failed = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=TELEMETRY_METRICS_PORT, host="127.0.0.1"):
+    """
+    Startar /metrics i en bakgrundstråd en gång per process. Är porten
+    upptagen (t.ex. av en annan arbetsprocess) hoppas endpointen över, och
+    försöket görs inte om vid nästa körning av appen.
+    """
+    global _server, _server_failed
+    with _server_lock:
+        if _server is not None or _server_failed or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            _server_failed = True
+            log.warning("Kunde inte starta metrics-endpointen på port %s: %s", port, e)
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
@@ -0,0 +1,104 @@
+# backend/vision_utils.py
+# Generering av målbilden med DALL-E, med snabb förhandsvisning och HD-uppgradering i bakgrunden
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.http_utils import http_post, OPENAI_BASE_URL, CONNECT_TIMEOUT, IMAGE_READ_TIMEOUT
+from backend.blob_store import get_blob_store
+from backend.telemetry import track_call, metrics
+
+# Läge per driftsättning:
+#   "preview"  - standardbild direkt, HD-versionen genereras i bakgrunden och byts in
+#   "hd"       - bara HD (långsammast och dyrast)
+#   "standard" - bara standardkvalitet
+VISION_IMAGE_MODE = os.getenv("VISION_IMAGE_MODE", "preview")
+VISION_IMAGE_MODEL = os.getenv("VISION_IMAGE_MODEL", "dall-e-3")
+VISION_IMAGE_SIZE = os.getenv("VISION_IMAGE_SIZE", "1024x1024")
+VISION_IMAGE_STYLE = os.getenv("VISION_IMAGE_STYLE", "vivid")
+
+# Delad trådpool för HD-uppgraderingar så att antalet samtidiga bildanrop är begränsat
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="vision-hd")
+
+
+def enhance_prompt(prompt):
+    """Förbättrar prompten för drömska bilder"""
+    return f"""
+    {prompt}
+
+    Skapa en drömsk, nästan magisk bild med mjuka, glödande färger och en känsla av transformation.
+    Bilden ska ha ett djup och en känslomässig kvalitet som inspirerar till hälsosamma val.
+    Använd en ljus, varm färgpalett med subtila blå och gröna toner som representerar hälsa och förnyelse.
+    """
+
+
+def request_image_url(prompt, quality="hd", api_key=None):
+    """Beställer en bild från bild-API:t och returnerar dess (kortlivade) URL"""
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    url = f"{OPENAI_BASE_URL}/images/generations"
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    data = {
+        "model": VISION_IMAGE_MODEL,
+        "prompt": enhance_prompt(prompt),
+        "n": 1,
+        "size": VISION_IMAGE_SIZE,
+        "quality": quality,
+        "style": VISION_IMAGE_STYLE
+    }
+
+    with track_call("image", VISION_IMAGE_MODEL, feature="malbild", quality=quality) as call:
+        response = http_post(url, headers=headers, json=data, timeout=(CONNECT_TIMEOUT, IMAGE_READ_TIMEOUT))
+        call.first_byte(response.elapsed.total_seconds())
+        if response.status_code != 200:
+            call.outcome = f"http_{response.status_code}"
+
+    if response.status_code == 200:
+        return response.json()['data'][0]['url']
+    raise Exception(f"Fel vid API-anrop: {response.text}")
+
+
+def record_latency(phase, seconds):
+    """Registrerar tiden till sparad bild per fas ("preview", "hd" eller "standard") i /metrics"""
+    metrics.observe("vision_image_seconds", {"phase": phase}, seconds)
+
+
+def generate_vision_blob(prompt, quality="hd", phase=None, api_key=None):
+    """
+    Genererar en bild, laddar ner den direkt och sparar den i blob-lagret.
+    Tiden från beställning till sparad bild registreras under phase.
+
+    Returns:
+        tuple: (blob-referens, latens i sekunder)
+    """
+    # asset_utils drar in PIL, som appen inte behöver vid start
+    from backend.asset_utils import download_image
+
+    start = time.perf_counter()
+    image_url = request_image_url(prompt, quality, api_key)
+    ref = get_blob_store().put(download_image(image_url))
+    elapsed = time.perf_counter() - start
+    record_latency(phase or quality, elapsed)
+    return ref, elapsed
+
+
+def first_phase(mode=None):
+    """
+    Kvaliteten som beställs först i givet läge och fasen dess latens
+    registreras under.
+
+    Returns:
+        tuple: (kvalitet, fas)
+    """
+    mode = mode or VISION_IMAGE_MODE
+    if mode == "hd":
+        return "hd", "hd"
+    return "standard", "preview" if mode == "preview" else "standard"
+
+
+def submit_hd_upgrade(prompt, api_key=None):
+    """Startar HD-versionen i bakgrunden; framtiden ger (blob-referens, latens)"""
+    return _executor.submit(generate_vision_blob, prompt, "hd", "hd", api_key)
@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Prestandamätningar som körs manuellt, t.ex. python -m benchmarks.bench_diagrams
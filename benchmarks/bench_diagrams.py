@@ -0,0 +1,80 @@
+# benchmarks/bench_diagrams.py
+# Jämför matplotlib- och Pillow-motorn för fyrfältsdiagrammen.
+# Kör med: python -m benchmarks.bench_diagrams [--runs 20]
+
+import argparse
+import statistics
+import time
+
+from backend.diagram_utils import parse_quadrant_sections, render_quadrant_diagram, clear_diagram_cache
+
+SAMPLE_TEXT = """
+1. Styrkefaktorer (befintliga vanor som främjar långt liv)
+- Du sover 7-8 timmar per natt vilket ger kroppen tid för återhämtning och cellförnyelse
+- Regelbunden träning tre gånger i veckan stärker hjärta, muskler och skelett
+- Du äter fet fisk och bär som ger omega-3 och antioxidanter
+- Du lagar mat från grunden de flesta dagar i veckan
+2. Utmaningar (vanor som kan minska livslängden)
+- Hög stressnivå i vardagen som ökar inflammation
+- Sent ätande på kvällen som stör sömnkvaliteten
+- Lågt intag av fermenterade livsmedel och fibrer
+- Mycket stillasittande under arbetsdagen
+3. Möjligheter (functional food och vanor att införa)
+- Inför kimchi, kefir eller surkål dagligen för en starkare tarmflora
+- Använd gurkmeja och ingefära i matlagningen för deras antiinflammatoriska effekt
+- Byt ut mellanmål mot nötter och frön
+- Ät en stor portion gröna bladgrönsaker varje dag
+4. Livsvisdom (djupare insikter om mat, hälsa och longevity)
+- Mat är medicin - varje måltid är en möjlighet att ge kroppen det den behöver
+- Gemenskap vid matbordet är lika viktig som maten i blå zoner
+- Små, hållbara förändringar slår stora, kortvariga insatser
+"""
+
+SECTIONS_ORDER = ['Styrkefaktorer', 'Utmaningar', 'Möjligheter', 'Livsvisdom']
+COLORS = {
+    'Styrkefaktorer': '#388E3C',
+    'Utmaningar': '#F57C00',
+    'Möjligheter': '#1976D2',
+    'Livsvisdom': '#7B1FA2'
+}
+KEYWORDS = [
+    ('Styrkefaktorer', ['styrk', 'befintliga']),
+    ('Utmaningar', ['utmaning', 'minska']),
+    ('Möjligheter', ['möjlighet', 'införa']),
+    ('Livsvisdom', ['visdom', 'insikt']),
+]
+
+
+def bench(engine, sections, runs, cached=False):
+    """Kör en uppvärmning och sedan runs mätningar, returnerar tider i ms och PNG-storlek"""
+    render_quadrant_diagram(sections, SECTIONS_ORDER, COLORS, engine=engine)
+    timings = []
+    size = 0
+    for _ in range(runs):
+        if not cached:
+            clear_diagram_cache()
+        start = time.perf_counter()
+        buf = render_quadrant_diagram(sections, SECTIONS_ORDER, COLORS, engine=engine)
+        timings.append((time.perf_counter() - start) * 1000)
+        size = len(buf.getvalue())
+    return timings, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jämför renderingsmotorerna för fyrfältsdiagram")
+    parser.add_argument("--runs", type=int, default=20, help="Antal mätningar per motor")
+    args = parser.parse_args()
+
+    import matplotlib
+    matplotlib.use("Agg")
+
+    sections = parse_quadrant_sections(SAMPLE_TEXT, KEYWORDS)
+    print(f"{'motor':<12}{'median ms':>12}{'min ms':>10}{'max ms':>10}{'PNG kB':>10}")
+    for engine, cached in (("matplotlib", False), ("pillow", False), ("cachad", True)):
+        timings, size = bench("pillow" if cached else engine, sections, args.runs, cached=cached)
+        print(f"{engine:<12}{statistics.median(timings):>12.1f}{min(timings):>10.1f}"
+              f"{max(timings):>10.1f}{size / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
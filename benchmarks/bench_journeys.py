@@ -0,0 +1,236 @@
+# benchmarks/bench_journeys.py
+# Mäter hela användarresor (intro -> kursplan -> PDF) mot den falska OpenAI-servern.
+# Kör med: python -m benchmarks.bench_journeys --users 20 --concurrency 4 --out resultat.json
+#
+# Resultatet skrivs som JSON med commit-hash så att körningar kan jämföras över tid.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import platform
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_openai import start_fake_server, add_latency_arguments, latency_settings
+
+# Stegen i en resa, i den ordning de körs
+STEPS = ["malbild", "longevity", "kursplan", "fraga", "pdf"]
+
+AKTIVITET = ["Låg (mest stillasittande)", "Måttlig (någon träning/vecka)", "Aktiv (3-5 träningspass/vecka)"]
+KOST = ["Blandkost", "Vegetarisk", "Medelhavskost", "Vegansk"]
+SUPERFOODS = ["Blåbär", "Grönkål", "Lax", "Valnötter", "Kimchi", "Gurkmeja", "Linfrö"]
+
+
+def make_profile(rng, index):
+    """En slumpad men reproducerbar profil; namnet gör varje resa unik för svarscachen"""
+    return {
+        "namn": f"Testperson {index}",
+        "alder": rng.randint(25, 80),
+        "aktivitet": rng.choice(AKTIVITET),
+        "stress": rng.choice(["Låg", "Måttlig", "Hög"]),
+        "somn": rng.choice(["5-6", "7-8", "8-9"]),
+        "kosthallning": rng.choice(KOST),
+        "superfoods": rng.sample(SUPERFOODS, 3),
+        "halsoutmaningar": ["Trötthet"],
+        "halsomal": "få mer energi",
+    }
+
+
+def make_question(profile):
+    """Frågan till Ulrika; namnet gör den unik så att svaret inte kommer från svarscachen"""
+    return f"Vad ska jag äta till frukost? Jag heter {profile['namn']}."
+
+
+def summarize(values):
+    """p50, p95, medel och max i millisekunder"""
+    from backend.bulk_reports import percentile
+    if not values:
+        return None
+    return {
+        "n": len(values),
+        "p50_ms": round(statistics.median(values) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "mean_ms": round(statistics.mean(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def run_journey(index, seed):
+    """
+    Kör en resa på samma sätt som sidorna gör det och returnerar tid per steg
+    i sekunder, samt tid till första textbit för de strömmade stegen.
+    """
+    from backend.openai_utils import (
+        generate_all_longevity,
+        generate_chatgpt_response_stream,
+        build_kursplan_prompt,
+        build_question_prompt,
+    )
+    from backend.vision_utils import first_phase, generate_vision_blob
+    from backend.blob_store import get_blob_store
+    from backend.pdf_utils import create_pdf_report
+
+    rng = random.Random(seed + index)
+    data = make_profile(rng, index)
+    timings = {}
+
+    start = time.perf_counter()
+    quality, phase = first_phase()
+    vision_ref, _ = generate_vision_blob(f"Målbild för {data['namn']}", quality, phase)
+    timings["malbild"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = generate_all_longevity(data)
+    fyrfalt_ref = get_blob_store().put(results["fyrfalt_image"])
+    timings["longevity"] = time.perf_counter() - start
+
+    for step, prompt in (("kursplan", build_kursplan_prompt(data)), ("fraga", build_question_prompt(make_question(data)))):
+        start = time.perf_counter()
+        parts = []
+        for delta in generate_chatgpt_response_stream(prompt, feature=step):
+            if not parts:
+                timings[f"{step}_ttft"] = time.perf_counter() - start
+            parts.append(delta)
+        timings[step] = time.perf_counter() - start
+        if step == "kursplan":
+            data["kursplan"] = "".join(parts)
+
+    start = time.perf_counter()
+    create_pdf_report(
+        data,
+        fyrfalt_text=results["fyrfalt_analys"],
+        fyrfalt_image=fyrfalt_ref,
+        livsmotto=results["livsmotto"],
+        vision_image=vision_ref,
+        full_analysis=True,
+    )
+    timings["pdf"] = time.perf_counter() - start
+    return timings
+
+
+def prepare_environment(base_url, prefix):
+    """
+    Pekar appen mot servern. Modulerna läser inställningarna när de importeras,
+    så detta måste göras före första backend-importen. Cacher och loggar hamnar
+    i en temporär katalog så att körningar inte påverkar varandra.
+    """
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.environ.update({
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "fake-key"),
+        "CHAT_CACHE_DIR": os.path.join(workdir, "cache"),
+        "BLOB_STORE_DIR": os.path.join(workdir, "blobs"),
+        "SESSION_DB_PATH": os.path.join(workdir, "sessions.sqlite"),
+        "TELEMETRY_LOG_PATH": os.path.join(workdir, "telemetry.jsonl"),
+        "TELEMETRY_METRICS_PORT": "0",
+    })
+    return workdir
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(users, concurrency, seed):
+    """Kör users resor med concurrency samtidiga och sammanställer resultatet"""
+    journeys = []
+    errors = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_journey, i, seed) for i in range(users)]
+        for i, future in enumerate(futures):
+            try:
+                journeys.append(future.result())
+            except Exception as e:
+                errors.append({"journey": i, "error": f"{type(e).__name__}: {e}"})
+    elapsed = time.perf_counter() - start
+
+    totals = [sum(t[step] for step in STEPS) for t in journeys]
+    keys = STEPS + ["kursplan_ttft", "fraga_ttft"]
+    return {
+        "users": users,
+        "concurrency": concurrency,
+        "completed": len(journeys),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "journeys_per_s": round(len(journeys) / elapsed, 3) if elapsed > 0 else 0.0,
+        "journey": summarize(totals),
+        "steps": {key: summarize([t[key] for t in journeys if key in t]) for key in keys},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mät hela användarresor mot en falsk OpenAI-server")
+    parser.add_argument("--users", type=int, default=10, help="Antal resor")
+    parser.add_argument("--concurrency", type=int, default=4, help="Antal samtidiga resor")
+    parser.add_argument("--base-url", help="Använd en redan startad server i stället för en egen")
+    parser.add_argument("--out", help="Skriv resultatet till denna JSON-fil (annars stdout)")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="KASSETT", help="Spela in all HTTP-trafik till en kassettfil")
+    cassette.add_argument("--replay", metavar="KASSETT", help="Spela upp en kassett i stället för att anropa en server")
+    parser.add_argument("--replay-speed", default="recorded", help="recorded, fast eller en faktor (t.ex. 2)")
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+    seed = args.seed if args.seed is not None else 0
+
+    server = None
+    base_url = args.base_url
+    if args.replay:
+        # Uppspelningen går aldrig ut på nätet, så adressen behöver inte finnas
+        base_url = base_url or "http://127.0.0.1:9/v1"
+        os.environ.update({"CASSETTE_MODE": "replay", "CASSETTE_PATH": args.replay, "CASSETTE_SPEED": args.replay_speed})
+    elif args.record:
+        os.environ.update({"CASSETTE_MODE": "record", "CASSETTE_PATH": args.record})
+        # Alla processer lägger till i samma fil, så den töms bara här.
+        # Importen sker efter miljövariablerna eftersom modulen läser dem.
+        from backend.cassette import start_recording
+        start_recording(args.record)
+    if base_url is None:
+        server, base_url = start_fake_server(**latency_settings(args))
+
+    prepare_environment(base_url, "bench_journeys_")
+
+    result = {
+        "benchmark": "journeys",
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {
+            **latency_settings(args),
+            "base_url": base_url,
+            "cassette": args.record or args.replay,
+            "cassette_mode": "record" if args.record else "replay" if args.replay else None,
+        },
+        **run(args.users, args.concurrency, seed),
+    }
+
+    from backend.prompt_utils import prompt_cache_stats
+    from backend.cache_utils import get_cache_stats
+    result["prompt_cache"] = prompt_cache_stats.get_stats()
+    result["response_cache"] = get_cache_stats()
+    if server is not None:
+        result["server_requests"] = server.fake.requests
+        server.shutdown()
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Resultat sparat i {args.out}", file=sys.stderr)
+    else:
+        print(output)
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+# benchmarks/bench_sessions.py
+# Kapacitetsmätning: många samtidiga sessioner av app.py i en process, körda
+# med Streamlits AppTest mot den falska OpenAI-servern.
+# Kör med: python -m benchmarks.bench_sessions --levels 1,2,4,8 --out kapacitet.json
+#
+# Varje session går intro -> livsstil -> matvanor -> longevity -> kursplan och
+# klickar och fyller i fält som en användare. Varje widgetändring eller klick
+# är en omkörning av skriptet, och tiden för den mäts.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_openai import start_fake_server, add_latency_arguments, latency_settings
+from benchmarks.bench_journeys import (
+    make_profile, make_question, summarize, prepare_environment, git_commit
+)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+# En omkörning som tar längre tid än så räknas som ett fel i sessionen
+RERUN_TIMEOUT = 120
+
+# Hur ofta en väntande PDF kollas, som fragmentet i appen
+PDF_POLL_INTERVAL = 0.5
+
+# Profilernas kosthållning med appens namn där de skiljer sig
+APP_KOST = {"Medelhavskost": "Medelhavsmat"}
+
+# Genomströmningen anses mättad när den ökar mindre än så mot föregående nivå
+SATURATION_GAIN = 1.10
+
+
+def current_rss():
+    """Processens RSS i byte (Linux), annars högsta RSS hittills"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss är i kB på Linux men i byte på macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _share_runtime():
+    """
+    AppTest är byggt för en session i taget. Tre saker delas därför mellan
+    sessionerna, så som de delas i en riktig Streamlit-server:
+
+    - Runtime._instance sätts vid början av varje körning och nollställs
+      efteråt, vilket i andra trådar slår ut körningar som pågår. Här faller
+      de tillbaka på en gemensam runtime.
+    - Varje körning kompilerar om app.py i en egen ScriptCache. ast.parse är
+      inte trådsäker i alla Python-versioner, och servern kompilerar bara en
+      gång, så alla körningar får samma cache.
+    - Konfigurationen global.appTest byts ut under varje körning och återställs
+      efteråt, så en avslutad körning stänger av den för de andra. Den sätts
+      i stället en gång för hela processen.
+    """
+    from contextlib import nullcontext
+    from unittest.mock import MagicMock
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+
+    def instance(cls):
+        return cls._instance if cls._instance is not None else shared
+
+    Runtime.instance = classmethod(instance)
+
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+    app_test.patch_config_options = lambda overrides: nullcontext()
+
+
+def _find(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    labels = ", ".join(repr(widget.label) for widget in widgets)
+    raise LookupError(f"Hittade ingen widget med etiketten {label!r} (finns: {labels})")
+
+
+class SimulatedSession:
+    """En användare som klickar sig igenom appen; varje omkörning tidmäts"""
+
+    def __init__(self, index, seed):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.profile = make_profile(random.Random(seed + index), index)
+        self.app = AppTest.from_file(APP_PATH, default_timeout=RERUN_TIMEOUT)
+        self.reruns = []
+
+    def _run(self, step, action=None):
+        """Kör om skriptet efter en ändring och sparar (steg, sekunder)"""
+        start = time.perf_counter()
+        if action is not None:
+            action()
+        self.app.run()
+        self.reruns.append((step, time.perf_counter() - start))
+        if self.app.exception:
+            raise RuntimeError(f"{step}: {self.app.exception[0].value}")
+
+    def set_value(self, step, kind, label, value):
+        self._run(step, lambda: _find(getattr(self.app, kind), label).set_value(value))
+
+    def click(self, step, label):
+        self._run(step, lambda: _find(self.app.button, label).click())
+
+    def create_pdf(self):
+        """
+        Beställer PDF:en och kör om tills den är klar, som fragmentet gör i
+        webbläsaren. Hela väntan räknas som steget pdf.
+        """
+        start = time.perf_counter()
+        _find(self.app.button, "Skapa PDF-rapport").click()
+        self.app.run()
+        while self.app.session_state["pdf_job_id"] and time.perf_counter() - start < RERUN_TIMEOUT:
+            time.sleep(PDF_POLL_INTERVAL)
+            self.app.run()
+        self.reruns.append(("pdf", time.perf_counter() - start))
+        if self.app.exception:
+            raise RuntimeError(f"pdf: {self.app.exception[0].value}")
+        if not self.app.session_state["pdf_bytes"]:
+            raise RuntimeError("pdf: ingen PDF skapades")
+
+    def stage(self):
+        return self.app.session_state["current_stage"]
+
+    def journey(self):
+        profile = self.profile
+        self._run("intro")
+        self.set_value("intro", "text_input", "Vad heter du?", profile["namn"])
+        self.click("intro", "Starta utvärderingen")
+
+        self.set_value("livsstil", "slider", "Hur gammal är du?", profile["alder"])
+        self.set_value("livsstil", "selectbox", "Hur skulle du beskriva din aktivitetsnivå?",
+                       profile["aktivitet"])
+        self.set_value("livsstil", "text_area", "Beskriv dina främsta hälsomål:", profile["halsomal"])
+        self.set_value("livsstil", "multiselect", "Har du några specifika hälsoutmaningar?", ["Trötthet/energibrist"])
+        self.click("livsstil", "Fortsätt till matvanor")
+
+        kost = APP_KOST.get(profile["kosthallning"], profile["kosthallning"])
+        self.set_value("matvanor", "selectbox", "Vilken kosthållning följer du främst?", kost)
+        self.set_value("matvanor", "multiselect", "Vilka av dessa superfoods äter du regelbundet?",
+                       ["Nötter och frön", "Fettig fisk", "Grönt te"])
+        self.click("malbild", "Generera personlig målbild")
+        self.click("matvanor", "Fortsätt till longevitetsanalys")
+
+        self.click("longevity_analys", "Generera hela longevitetsanalysen")
+        self.click("longevity", "Skapa din personliga kursplan")
+
+        self.click("kursplan_generering", "Generera kursplan")
+        self.set_value("kursplan", "text_input", "Ställ en fråga till Ulrika Davidsson:", make_question(profile))
+        self.click("fraga", "Få svar")
+        self.create_pdf()
+        if self.stage() != "kursplan":
+            raise RuntimeError(f"Sessionen hamnade i steget {self.stage()}")
+
+
+def run_level(sessions, concurrency, seed, first_index=0):
+    """
+    Kör sessions användare med concurrency samtidiga. Alla sessioner hålls
+    kvar till slutet så att minnet per session kan mätas. Sessionerna numreras
+    från first_index; varje nivå får egna profiler så att API-stegen inte
+    besvaras från svarscachen av en tidigare nivå.
+    """
+    import gc
+
+    gc.collect()
+    rss_before = current_rss()
+    finished = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index):
+        session = SimulatedSession(index, seed)
+        try:
+            session.journey()
+        except Exception as e:
+            with lock:
+                errors.append({"session": index, "error": f"{type(e).__name__}: {e}"})
+        with lock:
+            finished.append(session)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(first_index, first_index + sessions)))
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    rss_after = current_rss()
+    reruns = [(step, seconds) for session in finished for step, seconds in session.reruns]
+    steps = {}
+    for step, seconds in reruns:
+        steps.setdefault(step, []).append(seconds)
+    # Widgetändringar och sidbyten, utan stegen som väntar på API:t
+    interactive = [seconds for step, seconds in reruns if step in ("intro", "livsstil", "matvanor", "longevity", "kursplan")]
+
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "completed": sessions - len(errors),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "reruns": len(reruns),
+        "reruns_per_s": round(len(reruns) / elapsed, 2) if elapsed > 0 else 0.0,
+        "sessions_per_s": round((sessions - len(errors)) / elapsed, 3) if elapsed > 0 else 0.0,
+        "rerun": summarize([seconds for _, seconds in reruns]),
+        "interactive_rerun": summarize(interactive),
+        "steps": {step: summarize(values) for step, values in steps.items()},
+        "rss_before_mb": round(rss_before / 2**20, 1),
+        "rss_after_mb": round(rss_after / 2**20, 1),
+        "rss_per_session_kb": round((rss_after - rss_before) / sessions / 1024, 1) if sessions else 0.0,
+    }
+
+
+def find_saturation(levels, p95_budget_ms):
+    """
+    Första samtidighetsnivån där genomströmningen slutar öka märkbart eller
+    p95 för interaktiva omkörningar går över budgeten.
+    """
+    previous = None
+    for level in levels:
+        p95 = (level["interactive_rerun"] or {}).get("p95_ms")
+        if p95_budget_ms and p95 is not None and p95 > p95_budget_ms:
+            return {"concurrency": level["concurrency"], "reason": f"p95 {p95} ms över budgeten {p95_budget_ms} ms"}
+        if previous is not None and level["reruns_per_s"] < previous["reruns_per_s"] * SATURATION_GAIN:
+            return {"concurrency": level["concurrency"], "reason": "genomströmningen ökar inte längre"}
+        previous = level
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kapacitetsmätning av samtidiga Streamlit-sessioner")
+    parser.add_argument("--levels", default="1,2,4,8", help="Samtidighetsnivåer, kommaseparerade")
+    parser.add_argument("--sessions-per-level", type=int, default=None,
+                        help="Sessioner per nivå (standard: två per samtidig session)")
+    parser.add_argument("--p95-budget-ms", type=float, default=500,
+                        help="Högsta p95 för interaktiva omkörningar innan nivån räknas som mättad")
+    parser.add_argument("--base-url", help="Använd en redan startad server i stället för en egen")
+    parser.add_argument("--out", help="Skriv resultatet till denna JSON-fil (annars stdout)")
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+    seed = args.seed if args.seed is not None else 0
+    concurrency_levels = [int(level) for level in args.levels.split(",") if level.strip()]
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server, base_url = start_fake_server(**latency_settings(args))
+    prepare_environment(base_url, "bench_sessions_")
+    _share_runtime()
+
+    # En första resa laddar moduler, typsnitt och cacher; den räknas inte
+    print("Uppvärmning...", file=sys.stderr)
+    run_level(1, 1, seed)
+    next_index = 1
+
+    levels = []
+    for concurrency in concurrency_levels:
+        sessions = args.sessions_per_level or concurrency * 2
+        print(f"{concurrency} samtidiga sessioner ({sessions} totalt)...", file=sys.stderr)
+        levels.append(run_level(sessions, concurrency, seed, next_index))
+        next_index += sessions
+
+    result = {
+        "benchmark": "sessions",
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {
+            **latency_settings(args),
+            "base_url": base_url,
+            "vision_image_mode": os.getenv("VISION_IMAGE_MODE", "preview"),
+            "p95_budget_ms": args.p95_budget_ms,
+        },
+        "levels": levels,
+        "saturation": find_saturation(levels, args.p95_budget_ms),
+    }
+    if server is not None:
+        result["server_requests"] = server.fake.requests
+        server.shutdown()
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Resultat sparat i {args.out}", file=sys.stderr)
+    else:
+        print(output)
+    return 1 if any(level["errors"] for level in levels) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
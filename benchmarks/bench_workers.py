@@ -0,0 +1,163 @@
+# benchmarks/bench_workers.py
+# Skalning över flera Streamlit-processer: startar frontprocessen
+# (gunicorn server.proxy:app) med olika antal processer och mäter hur många
+# omkörningar per sekund samtidiga webbläsare får genom proxyn.
+# Kör med: python -m benchmarks.bench_workers --workers 1,2,4 --clients 16 --out skalning.json
+#
+# Varje klient öppnar Streamlits websocket precis som en webbläsare och ber
+# om omkörningar av startsidan i en slinga, så att det är skriptkörningen och
+# inte OpenAI-anropen som mäts.
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import platform
+import subprocess
+
+from benchmarks.fake_openai import start_fake_server
+from benchmarks.bench_journeys import summarize, prepare_environment, git_commit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Så länge får frontprocessen och alla Streamlit-processer på sig att starta
+START_TIMEOUT = 90
+
+
+def start_front(port, workers, base_port):
+    """Startar gunicorn med frontprocessen och väntar tills alla Streamlit-processer svarar"""
+    from server.supervisor import check_health, worker_ports
+
+    env = {**os.environ, "PORT": str(port), "APP_WORKERS": str(workers), "APP_BASE_PORT": str(base_port)}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "server.proxy:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if all(check_health(p) for p in worker_ports(workers, base_port)):
+            return process
+        if process.poll() is not None:
+            break
+        time.sleep(0.5)
+    stop_front(process)
+    raise RuntimeError(f"Frontprocessen med {workers} Streamlit-processer startade inte")
+
+
+def stop_front(process):
+    """Stoppar gunicorn, som i sin tur stoppar Streamlit-processerna"""
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+
+async def run_client(port, duration, latencies, workers_used):
+    """En webbläsare: omkörningar av startsidan tills tiden är ute"""
+    from websockets.asyncio.client import connect
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    rerun = BackMsg()
+    rerun.rerun_script.query_string = ""
+    rerun = rerun.SerializeToString()
+
+    async with connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"], max_size=None) as ws:
+        for cookie in ws.response.headers.get_all("set-cookie"):
+            if cookie.startswith("app_worker="):
+                workers_used.append(cookie.split(";")[0].split("=")[1])
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            await ws.send(rerun)
+            while True:
+                msg = ForwardMsg()
+                msg.ParseFromString(await ws.recv())
+                if msg.WhichOneof("type") == "script_finished":
+                    break
+            latencies.append(time.perf_counter() - start)
+
+
+async def run_clients(port, clients, duration):
+    latencies = []
+    workers_used = []
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_client(port, duration, latencies, workers_used) for _ in range(clients)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - started
+    errors = [repr(r) for r in results if isinstance(r, Exception)]
+    return latencies, workers_used, elapsed, errors
+
+
+def run_level(workers, clients, duration, port, base_port):
+    """Mäter genomströmningen med ett visst antal Streamlit-processer"""
+    process = start_front(port, workers, base_port)
+    try:
+        # En kort uppvärmning laddar appens moduler i varje process
+        asyncio.run(run_clients(port, workers, 2))
+        latencies, workers_used, elapsed, errors = asyncio.run(run_clients(port, clients, duration))
+    finally:
+        stop_front(process)
+    return {
+        "workers": workers,
+        "clients": clients,
+        "rerun": summarize(latencies),
+        "reruns_per_s": round(len(latencies) / elapsed, 1),
+        "clients_per_worker": {w: workers_used.count(w) for w in sorted(set(workers_used))},
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Skalning av genomströmningen över flera Streamlit-processer")
+    parser.add_argument("--workers", default=f"1,2,{os.cpu_count() or 1}",
+                        help="Antal Streamlit-processer att mäta, kommaseparerade")
+    parser.add_argument("--clients", type=int, default=16, help="Samtidiga webbläsare")
+    parser.add_argument("--duration", type=float, default=15, help="Sekunder per mätning")
+    parser.add_argument("--port", type=int, default=8700, help="Frontprocessens port")
+    parser.add_argument("--base-port", type=int, default=8710, help="Första Streamlit-processens port")
+    parser.add_argument("--out", help="Skriv resultatet till denna JSON-fil (annars stdout)")
+    args = parser.parse_args()
+    worker_counts = sorted({int(w) for w in args.workers.split(",") if w.strip()})
+
+    server, base_url = start_fake_server()
+    prepare_environment(base_url, "bench_workers_")
+
+    levels = []
+    for workers in worker_counts:
+        print(f"{workers} Streamlit-processer, {args.clients} klienter...", file=sys.stderr)
+        levels.append(run_level(workers, args.clients, args.duration, args.port, args.base_port))
+    for level in levels:
+        level["speedup"] = round(level["reruns_per_s"] / levels[0]["reruns_per_s"], 2) if levels[0]["reruns_per_s"] else None
+    server.shutdown()
+
+    result = {
+        "benchmark": "workers",
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "settings": {"clients": args.clients, "duration_s": args.duration},
+        "levels": levels,
+    }
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Resultat sparat i {args.out}", file=sys.stderr)
+    else:
+        print(output)
+    return 1 if any(level["errors"] for level in levels) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# benchmarks/check_import_time.py
+# Budget för appens starttid: mäter importerna i app.py med python -X importtime
+# och avslutar med felkod om de tar för lång tid eller drar in tunga paket.
+# Kör med: python -m benchmarks.check_import_time --budget-ms 100
+
+import os
+import re
+import ast
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# Paket som bara behövs när användaren kommer till analysen, diagrammen,
+# bilderna eller PDF:en och därför inte får importeras vid start
+HEAVY_MODULES = ("openai", "matplotlib", "numpy", "fpdf", "PIL", "httpx", "requests")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def app_imports(path=APP_PATH):
+    """Modulerna som app.py importerar på toppnivå, i ordning"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        modules.extend(name for name in names if name not in modules)
+    return modules
+
+
+def measure(modules):
+    """
+    Importerar streamlit och sedan appens moduler i en ny process. streamlit
+    importeras först så att det som den redan drar in inte räknas mot appen.
+
+    Returns:
+        tuple: (streamlit i ms, appens moduler i ms, {modul: kumulativ ms}, alla moduler som appen laddade)
+    """
+    code = "import streamlit\n" + "".join(f"import {name}\n" for name in modules if name != "streamlit")
+    env = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "fake-key")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importen misslyckades:\n{result.stderr[-2000:]}")
+
+    streamlit_us = 0
+    after_streamlit = False
+    top_level = {}
+    loaded = set()
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        if not after_streamlit:
+            if name == "streamlit" and len(indent) == 1:
+                streamlit_us = cumulative
+                after_streamlit = True
+            continue
+        loaded.add(name)
+        if len(indent) == 1:
+            top_level[name] = cumulative / 1000
+    return streamlit_us / 1000, sum(top_level.values()), top_level, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kontrollera att appens importer håller sig inom budgeten")
+    parser.add_argument("--budget-ms", type=float, default=100,
+                        help="Högsta tillåtna importtid för appens egna moduler (utöver streamlit)")
+    parser.add_argument("--runs", type=int, default=5, help="Antal mätningar; den snabbaste räknas")
+    args = parser.parse_args()
+
+    modules = app_imports()
+    runs = [measure(modules) for _ in range(max(1, args.runs))]
+    streamlit_ms, app_ms, top_level, loaded = min(runs, key=lambda run: run[1])
+
+    print(f"streamlit: {streamlit_ms:.1f} ms")
+    print(f"appens importer: {app_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, ms in sorted(top_level.items(), key=lambda item: -item[1]):
+        print(f"  {name:<32} {ms:8.1f} ms")
+
+    failures = []
+    if app_ms > args.budget_ms:
+        failures.append(f"Importerna tar {app_ms:.1f} ms, budgeten är {args.budget_ms:.0f} ms")
+    heavy = sorted({name.split(".")[0] for name in loaded} & set(HEAVY_MODULES))
+    if heavy:
+        failures.append(f"Tunga paket importeras vid start: {', '.join(heavy)}")
+
+    for failure in failures:
+        print(f"FEL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+# benchmarks/fake_openai.py
+# Lokal ersättare för OpenAI-API:t så att prestandamätningar inte kostar API-krediter.
+# Kör fristående med: python -m benchmarks.fake_openai --port 8765 --latency-ms 300
+# och peka appen mot den med OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+
+import io
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+SAMPLE_TEXT = (
+    "Din kost med mycket grönsaker, baljväxter och fet fisk är en stark grund för ett långt liv. "
+    "Sömnen och den dagliga rörelsen hjälper kroppen att återhämta sig och hålla inflammationen nere. "
+    "Prova att lägga till fermenterade grönsaker, bär och en näve nötter varje dag, "
+    "och se måltiden som ett tillfälle att ge kroppen det den behöver. "
+)
+
+# API:t cachar prefix i block om 128 tokens från 1024 tokens och uppåt
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class FakeOpenAI:
+    """
+    Tillstånd för den falska servern: latensinställningar, en cache av
+    sedda prompt-prefix (för cached_tokens) och den genererade testbilden.
+    """
+
+    def __init__(self, latency_ms=300, jitter_ms=100, token_ms=5, image_ms=2000, completion_tokens=300, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.image_ms = image_ms
+        self.completion_tokens = completion_tokens
+        self._random = random.Random(seed)
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+        self._image = None
+        self.requests = 0
+
+    def sleep(self, base_ms):
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            self.requests += 1
+        time.sleep(max(0.0, base_ms + jitter) / 1000)
+
+    def usage(self, messages, completion_tokens):
+        """Räknar tokens och hur stor del av prefixet som setts förut"""
+        system = "".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") + 4 for m in messages)
+        prefix_tokens = estimate_tokens(system)
+        with self._lock:
+            seen = system in self._seen_prefixes
+            self._seen_prefixes.add(system)
+        cached = 0
+        if seen and prefix_tokens >= CACHE_MIN_TOKENS:
+            cached = prefix_tokens - prefix_tokens % CACHE_BLOCK_TOKENS
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    def completion_text(self, request):
+        """Svarstext, eller JSON som följer ett angivet json_schema"""
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            content = {}
+            for key, spec in schema.get("properties", {}).items():
+                if spec.get("type") == "array":
+                    content[key] = [f"Punkt {i + 1} om {key}" for i in range(4)]
+                else:
+                    content[key] = SAMPLE_TEXT.strip()
+            return json.dumps(content, ensure_ascii=False)
+
+        words = []
+        sample = SAMPLE_TEXT.split()
+        tokens = min(self.completion_tokens, request.get("max_tokens") or self.completion_tokens)
+        while len(words) < tokens:
+            words.extend(sample)
+        return " ".join(words[:tokens])
+
+    def image_png(self):
+        """En 1024x1024 PNG med en mjuk gradient, skapad en gång"""
+        with self._lock:
+            if self._image is None:
+                gradient = Image.linear_gradient("L").resize((1024, 1024))
+                image = Image.merge("RGB", (gradient, gradient.rotate(90), gradient.rotate(180)))
+                buf = io.BytesIO()
+                image.save(buf, format="PNG")
+                self._image = buf.getvalue()
+            return self._image
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": "gpt-4o", "object": "model"}]})
+        elif "/files/" in self.path:
+            body = self.fake.image_png()
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json({"error": {"message": f"Okänd sökväg {self.path}"}}, status=404)
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path.endswith("/chat/completions"):
+            if request.get("stream"):
+                self._stream_chat(request)
+            else:
+                self._chat(request)
+        elif self.path.endswith("/images/generations"):
+            self._image(request)
+        else:
+            self._send_json({"error": {"message": f"Okänd sökväg {self.path}"}}, status=404)
+
+    def _chat(self, request):
+        text = self.fake.completion_text(request)
+        completion_tokens = estimate_tokens(text)
+        # Utan strömning kommer svaret först när hela texten är genererad
+        self.fake.sleep(self.fake.latency_ms + completion_tokens * self.fake.token_ms)
+        self._send_json({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": self.fake.usage(request.get("messages", []), completion_tokens),
+        })
+
+    def _stream_chat(self, request):
+        text = self.fake.completion_text(request)
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def event(choices, usage=None):
+            payload = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": choices,
+            }
+            if usage is not None:
+                payload["usage"] = usage
+            data = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        self.fake.sleep(self.fake.latency_ms)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            delta = word if i == 0 else " " + word
+            event([{"index": 0, "delta": {"content": delta}, "finish_reason": None}])
+            time.sleep(self.fake.token_ms / 1000)
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (request.get("stream_options") or {}).get("include_usage"):
+            event([], self.fake.usage(request.get("messages", []), len(words)))
+        done = b"data: [DONE]\n\n"
+        self.wfile.write(f"{len(done):x}\r\n".encode() + done + b"\r\n0\r\n\r\n")
+        self.wfile.flush()
+
+    def _image(self, request):
+        # HD tar ungefär dubbelt så lång tid som standard, som hos det riktiga API:t
+        factor = 2 if request.get("quality") == "hd" else 1
+        self.fake.sleep(self.fake.image_ms * factor)
+        host, port = self.server.server_address[:2]
+        self._send_json({
+            "created": int(time.time()),
+            "data": [{"url": f"http://{host}:{port}/v1/files/image-{uuid.uuid4().hex}.png"}],
+        })
+
+
+def start_fake_server(port=0, host="127.0.0.1", **settings):
+    """
+    Startar den falska servern i en bakgrundstråd.
+
+    Returns:
+        tuple: (server, bas-URL att sätta som OPENAI_BASE_URL)
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.fake = FakeOpenAI(**settings)
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_latency_arguments(parser):
+    """Latensflaggor som delas av servern och mätskripten"""
+    parser.add_argument("--latency-ms", type=float, default=300, help="Latens före första token")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="Slumpmässig variation (+/-)")
+    parser.add_argument("--token-ms", type=float, default=5, help="Tid per genererad token")
+    parser.add_argument("--image-ms", type=float, default=2000, help="Tid för en standardbild (HD tar dubbelt)")
+    parser.add_argument("--completion-tokens", type=int, default=300, help="Längd på textsvaren")
+    parser.add_argument("--seed", type=int, default=None, help="Frö för jittret")
+
+
+def latency_settings(args):
+    return dict(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        token_ms=args.token_ms,
+        image_ms=args.image_ms,
+        completion_tokens=args.completion_tokens,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokal ersättare för OpenAI-API:t")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(args.port, args.host, **latency_settings(args))
+    print(f"Falsk OpenAI-server på {base_url}; sätt OPENAI_BASE_URL={base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
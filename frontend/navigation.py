@@ -1,7 +1,7 @@
 # frontend/navigation.py
 
 import streamlit as st
-from backend.session_utils import save_progress, load_progress
+from backend.session_store import infer_stage
 
 def create_sidebar():
     """Skapar sidofältet med navigationsknappar och information"""
@@ -91,8 +91,20 @@ def reset_session():
     """Återställer sessionen till ursprungsläget"""
     st.session_state.user_data = {}
     st.session_state.conversation_history = []
+    st.session_state.conversation_summary = None
+    st.session_state.summary_job = None
     st.session_state.current_stage = 'intro'
-    st.session_state.pdf_path = None
+    st.session_state.pdf_bytes = None
+    st.session_state.pdf_version = None
+    # Ett pågående PDF-jobb avbryts och glöms så att resultatet inte blir kvar i minnet
+    if st.session_state.get('pdf_job_id'):
+        from backend.job_utils import pdf_jobs
+        pdf_jobs.cancel(st.session_state.pdf_job_id)
+        pdf_jobs.forget(st.session_state.pdf_job_id)
+    st.session_state.pdf_job_id = None
+    st.session_state.vision_image = None
+    st.session_state.vision_upgrade = None
+    st.session_state.fyrfalt_image = None
     st.session_state.swot_analysis = None
     st.session_state.swot_image = None
     st.session_state.manifest = None
@@ -111,13 +123,4 @@ def get_current_stage_name():
 
 def determine_stage_from_data(user_data):
     """Bestämmer lämpligt steg baserat på data som laddats"""
-    if 'kursplan' in user_data:
-        return 'kursplan'
-    elif user_data.get('superfoods') or user_data.get('kosthallning'):
-        return 'longevity'
-    elif user_data.get('alder') and user_data.get('aktivitet'):
-        return 'matvanor'
-    elif user_data.get('namn'):
-        return 'livsstil'
-    else:
-        return 'intro' 
\ No newline at end of file
+    return infer_stage(user_data)
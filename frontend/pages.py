@@ -1,16 +1,14 @@
 # frontend/pages.py
 
+import logging
+
 import streamlit as st
-from backend.openai_utils import (
-    generate_chatgpt_response, 
-    search_web, 
-    generate_logo, 
-    generate_swot_analysis, 
-    create_swot_diagram, 
-    generate_company_manifest
-)
-from backend.pdf_utils import create_pdf_report, get_pdf_download_link
-import os
+from backend.blob_store import get_blob_store, is_blob_ref
+
+# openai_utils, pdf_utils och deras tunga beroenden (openai, matplotlib, fpdf)
+# importeras i funktionerna som använder dem, så att introsidan startar snabbt
+
+log = logging.getLogger(__name__)
 
 def intro_page():
     st.title("Välkommen till Functional Food & Longevity")
@@ -169,20 +167,41 @@ def matvanor_page():
     if st.button("Generera personlig målbild"):
         with st.spinner("Skapar din hälsomålbild..."):
             try:
-                from app import generate_vision_image
                 prompt = f"""Skapa en drömsk, magisk och inspirerande bild som representerar en optimal hälsosam livsstil för {st.session_state.user_data.get('namn', 'en person')} som vill {st.session_state.user_data.get('halsomal', 'leva hälsosamt')}. 
                 
                 Bilden ska vara fantasifull och nästan spirituell med en känsla av transformation. Inkludera vackra, vibrerande färger, mjukt ljus och en känsla av välbefinnande. Visa näringsrika, levande råvaror som strålar av energi, där varje ingrediens verkar ha en glödande aura.
                 
                 Inkludera subtila symboler för longevity och livskraft som en strömmande källa av klart vatten, spirande växter, och kanske ett vackert träd som representerar livets resa. Atmosfären ska vara lugnande och hoppfull, som en perfekt drömbild av hur functional food och rätt livsstil kan transformera ens hälsa och liv."""
                 
-                image_url = generate_vision_image(prompt)
-                st.session_state.vision_image = image_url
-                st.image(image_url, caption="Din personliga hälsomålbild", width=400)
+                from backend.vision_utils import (
+                    VISION_IMAGE_MODE, first_phase, generate_vision_blob, submit_hd_upgrade
+                )
+                # Bilden laddas ner direkt och sparas i blob-lagret, eftersom URL:en går ut;
+                # sessionen håller bara referensen. I förhandsläget beställs HD-versionen
+                # först, så att den genereras samtidigt som standardbilden som visas direkt.
+                quality, phase = first_phase()
+                hd_future = submit_hd_upgrade(prompt) if VISION_IMAGE_MODE == "preview" else None
+                st.session_state.vision_upgrade = None
+                try:
+                    st.session_state.vision_image, _ = generate_vision_blob(prompt, quality, phase)
+                finally:
+                    # Misslyckas standardbilden ersätter HD-versionen den tidigare bilden
+                    if hd_future is not None:
+                        st.session_state.vision_upgrade = {
+                            "source": st.session_state.get('vision_image'),
+                            "future": hd_future,
+                        }
                 st.success("Din målbild är klar! Reflektera över hur denna vision kan bli din verklighet med rätt kunskap och vägledning.")
             except Exception as e:
                 st.error(f"Kunde inte generera målbild: {str(e)}")
     
+    # Visa målbilden; medan HD-versionen skapas körs bara bildblocket om varje sekund
+    poll_interval = 1 if st.session_state.get('vision_upgrade') else None
+    st.fragment(show_vision_image, run_every=poll_interval)()
+    
+    # Starta longevity-analys och livsmotto i bakgrunden när profilen är stabil
+    get_prefetcher().observe(st.session_state.user_data)
+    
     if st.button("Fortsätt till longevitetsanalys"):
         st.session_state.current_stage = "longevity"
         st.rerun()
@@ -191,23 +210,46 @@ def longevity_page():
     st.title("Longevitetsanalys")
     st.write("Nu ska vi utforska hur dina livsvanor och matval påverkar din långsiktiga hälsa och livslängd.")
     
+    # Generera alla delar samtidigt i stället för en knapp i taget
+    if st.button("Generera hela longevitetsanalysen"):
+        with st.spinner("Skapar analys, diagram, livsmotto och longevitetsfaktorer..."):
+            from backend.openai_utils import generate_all_longevity
+            
+            results = generate_all_longevity(st.session_state.user_data, prefetcher=get_prefetcher())
+            st.session_state.fyrfalt_analys = results["fyrfalt_analys"]
+            st.session_state.fyrfalt_image = get_blob_store().put(results["fyrfalt_image"])
+            st.session_state.livsmotto = results["livsmotto"]
+            st.session_state.longevity_faktorer = results["longevity_faktorer"]
+        
+        st.subheader("Fyrfältsanalys för ditt hälsosamma åldrande")
+        st.markdown(results["fyrfalt_analys"].to_markdown())
+        show_blob_image(st.session_state.fyrfalt_image, "display_wide", caption="Din personliga fyrfältsanalys", use_column_width=True)
+        
+        st.markdown("### Ditt livsmotto")
+        st.markdown(f"<div style='padding: 20px; border-radius: 10px; background-color: #F1F8E9; border-left: 4px solid #2E7D5A;'>{results['livsmotto']}</div>", unsafe_allow_html=True)
+        
+        st.subheader("Dina longevitetsfaktorer")
+        st.write(results["longevity_faktorer"])
+        st.markdown("---")
+    
     # "Fyrfältare" istället för SWOT-analys
     st.subheader("Fyrfältsanalys för ditt hälsosamma åldrande")
     if st.button("Generera fyrfältsanalys"):
         with st.spinner("Analyserar dina vanor för optimal livslängd..."):
-            from backend.openai_utils import generate_longevity_analysis, create_longevity_diagram
+            from backend.openai_utils import generate_longevity_analysis_structured, create_longevity_diagram
             
-            # Generera textanalys
-            fyrfalt_text = generate_longevity_analysis(st.session_state.user_data)
-            st.session_state.fyrfalt_analys = fyrfalt_text
+            # Generera strukturerad analys, eller hämta den som förberäknats i bakgrunden
+            fyrfalt_analys = get_prefetcher().get_or_run(
+                "fyrfalt_analys", generate_longevity_analysis_structured, st.session_state.user_data
+            )
+            st.session_state.fyrfalt_analys = fyrfalt_analys
             
-            # Visa textanalys
-            st.write(fyrfalt_text)
+            # Visa analysen
+            st.markdown(fyrfalt_analys.to_markdown())
             
-            # Skapa och visa diagram
-            fyrfalt_image = create_longevity_diagram(fyrfalt_text)
-            st.session_state.fyrfalt_image = fyrfalt_image
-            st.image(fyrfalt_image, caption="Din personliga fyrfältsanalys", use_column_width=True)
+            # Skapa och visa diagram direkt från sektionerna
+            st.session_state.fyrfalt_image = get_blob_store().put(create_longevity_diagram(fyrfalt_analys))
+            show_blob_image(st.session_state.fyrfalt_image, "display_wide", caption="Din personliga fyrfältsanalys", use_column_width=True)
     
     # Livsmotto istället för företagsmanifest
     st.subheader("Ditt personliga livsmotto")
@@ -215,7 +257,9 @@ def longevity_page():
         with st.spinner("Skapar ditt personliga livsmotto..."):
             from backend.openai_utils import generate_life_motto
             
-            livsmotto = generate_life_motto(st.session_state.user_data)
+            livsmotto = get_prefetcher().get_or_run(
+                "livsmotto", generate_life_motto, st.session_state.user_data
+            )
             st.session_state.livsmotto = livsmotto
             
             st.markdown("### Ditt livsmotto")
@@ -225,21 +269,10 @@ def longevity_page():
     st.subheader("Dina longevitetsfaktorer")
     if st.button("Analysera longevitetsfaktorer"):
         with st.spinner("Analyserar faktorer som påverkar din potentiella livslängd..."):
-            from backend.openai_utils import generate_chatgpt_response
+            from backend.openai_utils import generate_longevity_factors
             
-            data = st.session_state.user_data
-            longevity_prompt = (
-                f"Baserat på följande information om {data.get('namn', 'personen')}: "
-                f"Ålder: {data.get('alder', 'N/A')}, Aktivitetsnivå: {data.get('aktivitet', 'N/A')}, "
-                f"Stressnivå: {data.get('stress', 'N/A')}, Sömnmängd: {data.get('somn', 'N/A')}, "
-                f"Kosthållning: {data.get('kosthallning', 'N/A')}, "
-                f"Regelbundna superfoods: {', '.join(data.get('superfoods', ['N/A']))}, "
-                f"Identifiera de tre viktigaste faktorerna som påverkar personens potentiella livslängd positivt "
-                f"och de tre faktorer som bör förbättras. Ge konkreta och personliga rekommendationer om hur dessa förbättringar "
-                f"kan göras med hjälp av functional food principer enligt Ulrika Davidssons filosofi. "
-                f"Var specifik och personlig i dina rekommendationer."
-            )
-            longevity_analys = generate_chatgpt_response(longevity_prompt)
+            longevity_analys = generate_longevity_factors(st.session_state.user_data)
+            st.session_state.longevity_faktorer = longevity_analys
             st.write(longevity_analys)
     
     if st.button("Skapa din personliga kursplan"):
@@ -279,9 +312,10 @@ def kursplan_page():
             
         with col2:
             st.subheader("Status")
+            apply_vision_upgrade()
             if 'vision_image' in st.session_state and st.session_state.vision_image:
                 st.write("✅ Målbild genererad")
-                st.image(st.session_state.vision_image, width=100)
+                show_blob_image(st.session_state.vision_image, "thumb", width=100)
             else:
                 st.write("❌ Målbild ej genererad")
                 
@@ -303,31 +337,11 @@ def kursplan_page():
     # Generera personlig kursplan med säljfokus
     st.subheader("Din personliga kursplan")
     if st.button("Generera kursplan"):
-        data = st.session_state.user_data
-        prompt = (
-            f"Skapa en personlig 8-veckors kursplan inom Functional Food och Longevity för {data.get('namn', 'kursdeltagaren')}. "
-            f"Personen är {data.get('alder', 'N/A')} år, har aktivitetsnivån {data.get('aktivitet', 'N/A')}, "
-            f"följer en {data.get('kosthallning', 'blandad')} kost, "
-            f"har specifika hälsoutmaningar som {', '.join(data.get('halsoutmaningar', ['inga speciella']))}. "
-            f"Deras hälsomål är att {data.get('halsomal', 'förbättra sin hälsa')}. "
-            f"Kursen ska innehålla veckovisa fokusområden med: "
-            f"1. Ett tema för veckan "
-            f"2. Tre superfoods att fokusera på "
-            f"3. En praktisk utmaning "
-            f"4. Ett recept att testa "
-            f"5. En insikt från Ulrika Davidsson "
-            f"6. En försmak på vad den fullständiga kursen skulle fördjupa sig i "
-            f"Gör planen personlig baserat på den information som givits om personen, och gör det klart att detta bara är en introduktion "
-            f"och att den fullständiga kursen med Ulrika skulle innehålla mycket mer djupgående information, personlig coachning och "
-            f"verktyg för transformation. Avsluta med en uppmuntrande inbjudan till den fullständiga kursen."
-        )
-        
-        with st.spinner("Genererar din personliga kursplan... (detta kan ta upp till 30 sekunder)"):
-            from backend.openai_utils import generate_chatgpt_response
-            kursplan = generate_chatgpt_response(prompt, temperature=0.7)
-            st.session_state.user_data["kursplan"] = kursplan
-        
-        st.markdown(kursplan)
+        from backend.openai_utils import generate_chatgpt_response_stream, build_kursplan_prompt
+        prompt = build_kursplan_prompt(st.session_state.user_data)
+        # Strömma kursplanen så att texten syns direkt i stället för efter hela genereringen
+        kursplan = render_stream(generate_chatgpt_response_stream(prompt, temperature=0.7, feature="kursplan"), st.empty())
+        st.session_state.user_data["kursplan"] = kursplan
     
     # Visa kursplanen om den redan har genererats
     if 'kursplan' in st.session_state.user_data:
@@ -353,50 +367,188 @@ def kursplan_page():
     
     # Knapp för att skapa PDF
     st.subheader("PDF-rapport")
+    pdf_args = dict(
+        fyrfalt_text=st.session_state.get('fyrfalt_analys', None),
+        fyrfalt_image=st.session_state.get('fyrfalt_image', None),
+        livsmotto=st.session_state.get('livsmotto', None),
+        vision_image=st.session_state.get('vision_image', None),
+        full_analysis=True  # Lägg till hela analysen
+    )
     if st.button("Skapa PDF-rapport"):
-        with st.spinner("Skapar din personliga hälsorapport..."):
-            try:
-                from backend.pdf_utils import create_pdf_report
-                pdf_path = create_pdf_report(
-                    st.session_state.user_data,
-                    fyrfalt_text=st.session_state.get('fyrfalt_analys', None),
-                    fyrfalt_image=st.session_state.get('fyrfalt_image', None),
-                    livsmotto=st.session_state.get('livsmotto', None),
-                    vision_image=st.session_state.get('vision_image', None),
-                    full_analysis=True  # Lägg till hela analysen
-                )
-                st.session_state.pdf_path = pdf_path
-                st.success(f"PDF skapad! Filnamn: {pdf_path}")
-                
-                # Visa länk för att ladda ner PDF
-                from backend.pdf_utils import get_pdf_download_link
-                download_link = get_pdf_download_link(pdf_path, "Klicka här för att ladda ner din personliga hälsorapport som PDF")
-                st.markdown(download_link, unsafe_allow_html=True)
-            except Exception as e:
-                st.error(f"Ett fel uppstod när PDF-filen skulle skapas: {str(e)}")
+        from backend.pdf_utils import pdf_content_version
+        from backend.job_utils import pdf_jobs
+        
+        # Bygg bara om PDF:en när innehållet har ändrats, och i en separat process
+        version = pdf_content_version(st.session_state.user_data, **pdf_args)
+        if st.session_state.get('pdf_version') == version:
+            st.success("PDF:en är redan skapad!")
+        elif not st.session_state.get('pdf_job_id'):
+            st.session_state.pdf_job_id = pdf_jobs.submit(st.session_state.user_data, **pdf_args)
+            st.session_state.pdf_job_version = version
+    
+    # Följ upp pågående PDF-jobb; medan det pågår körs bara förloppsblocket om
+    poll_interval = 0.5 if st.session_state.get('pdf_job_id') else None
+    st.fragment(show_pdf_job, run_every=poll_interval)()
+    
+    # Meddelande från ett PDF-jobb som blev klart vid förra körningen
+    notice = st.session_state.pop('pdf_job_notice', None)
+    if notice:
+        getattr(st, notice[0])(notice[1])
+    
+    # Visa nedladdningsknapp för senast skapade PDF
+    if st.session_state.get('pdf_bytes'):
+        from backend.pdf_utils import get_pdf_filename
+        st.download_button(
+            "Klicka här för att ladda ner din personliga hälsorapport som PDF",
+            data=st.session_state.pdf_bytes,
+            file_name=get_pdf_filename(),
+            mime="application/pdf"
+        )
     
     # Frågesektion
     st.subheader("Har du frågor om functional food eller longevity?")
     user_question = st.text_input("Ställ en fråga till Ulrika Davidsson:")
     
+    # Byt in en sammanfattning som har blivit klar i bakgrunden sedan förra frågan
+    summary_job = st.session_state.get('summary_job')
+    if summary_job:
+        from backend.memory_utils import apply_compaction
+        history, summary, finished = apply_compaction(
+            summary_job,
+            st.session_state.conversation_history,
+            st.session_state.get('conversation_summary')
+        )
+        st.session_state.conversation_history = history
+        st.session_state.conversation_summary = summary
+        if finished:
+            st.session_state.summary_job = None
+    
     if user_question and st.button("Få svar"):
-        from backend.openai_utils import generate_chatgpt_response
+        from backend.openai_utils import generate_chatgpt_response_stream, build_question_prompt
+        from backend.memory_utils import start_compaction, build_memory_messages
         
-        # Lägg till frågan i konversationshistoriken
-        st.session_state.conversation_history.append({"role": "user", "content": user_question})
+        history = st.session_state.conversation_history
+        summary = st.session_state.get('conversation_summary')
         
-        # Generera svar
-        answer = generate_chatgpt_response(
-            f"Fråga om functional food och longevity: {user_question}. Ge ett informativt men också säljande svar som väcker intresse för hela kursen.", 
-            history=st.session_state.conversation_history[-10:] if len(st.session_state.conversation_history) > 0 else []
+        # Generera och visa svaret allteftersom det strömmar in
+        st.write("**Ulrika Davidsson svarar:**")
+        answer = render_stream(
+            generate_chatgpt_response_stream(
+                build_question_prompt(user_question),
+                history=build_memory_messages(history, summary),
+                feature="fraga"
+            ),
+            st.empty()
         )
         
-        # Lägg till svaret i konversationshistoriken
+        # Lägg till frågan och svaret i konversationshistoriken
+        st.session_state.conversation_history.append({"role": "user", "content": user_question})
         st.session_state.conversation_history.append({"role": "assistant", "content": answer})
         
-        # Visa svaret
-        st.write("**Ulrika Davidsson svarar:**")
-        st.write(answer)
+        # Håll historiken inom tokenbudgeten; äldre turer bakas in i en rullande
+        # sammanfattning i bakgrunden och byts in vid en senare körning
+        if not st.session_state.get('summary_job'):
+            st.session_state.summary_job = start_compaction(history, summary)
+
+def show_pdf_job():
+    """
+    Visar förloppet för sessionens PDF-jobb. Körs som ett fragment som kollar
+    jobbet varannan halvsekund; när jobbet är avslutat körs hela sidan om en
+    gång så att nedladdningsknappen visas och kollen upphör.
+    """
+    job_id = st.session_state.get('pdf_job_id')
+    if not job_id:
+        return
+    from backend.job_utils import pdf_jobs
+    
+    status = pdf_jobs.status(job_id)
+    if status["state"] in ("pending", "running"):
+        section = status.get("section") or "väntar i kö"
+        st.progress(status["done"] / status["total"], text=f"Skapar din personliga hälsorapport... ({section})")
+        if st.button("Avbryt PDF-rapport"):
+            pdf_jobs.cancel(job_id)
+        return
+    
+    if status["state"] == "done":
+        st.session_state.pdf_bytes = pdf_jobs.result(job_id)
+        st.session_state.pdf_version = st.session_state.get('pdf_job_version')
+        st.session_state.pdf_job_notice = ("success", "PDF skapad!")
+    elif status["state"] == "cancelled":
+        st.session_state.pdf_job_notice = ("info", "Skapandet av PDF-rapporten avbröts.")
+    elif status["state"] == "failed":
+        st.session_state.pdf_job_notice = ("error", f"Ett fel uppstod när PDF-filen skulle skapas: {status.get('error')}")
+    pdf_jobs.forget(job_id)
+    st.session_state.pdf_job_id = None
+    st.rerun()
+
+def get_prefetcher():
+    """Returnerar sessionens spekulativa förberäknare"""
+    if 'prefetcher' not in st.session_state:
+        from backend.prefetch_utils import SpeculativePrefetcher
+        st.session_state.prefetcher = SpeculativePrefetcher()
+    return st.session_state.prefetcher
+
+def apply_vision_upgrade():
+    """
+    Byter in HD-versionen av målbilden om bakgrundsjobbet är klart. Resultatet
+    ignoreras om en ny målbild har genererats sedan jobbet startades.
+    
+    Returns:
+        bool: True om bilden byttes ut vid detta anrop
+    """
+    upgrade = st.session_state.get('vision_upgrade')
+    if not upgrade or not upgrade["future"].done():
+        return False
+    
+    st.session_state.vision_upgrade = None
+    try:
+        hd_ref, _ = upgrade["future"].result()
+    except Exception as e:
+        # Förhandsbilden duger om HD-versionen misslyckas
+        log.warning("Kunde inte skapa HD-version av målbilden: %s", e)
+        return False
+    if st.session_state.get('vision_image') != upgrade["source"]:
+        return False
+    st.session_state.vision_image = hd_ref
+    return True
+
+def show_vision_image():
+    """
+    Visar målbilden och byter in HD-versionen när den är klar. Körs som ett
+    fragment som kollar varje sekund medan HD-versionen skapas; när den har
+    bytts in körs hela sidan om en gång så att kollen upphör.
+    """
+    if apply_vision_upgrade():
+        st.rerun()
+    if st.session_state.get('vision_image'):
+        show_blob_image(st.session_state.vision_image, "display", caption="Din personliga hälsomålbild", width=400)
+        if st.session_state.get('vision_upgrade'):
+            st.caption("En HD-version av målbilden skapas i bakgrunden...")
+
+def render_stream(stream, placeholder):
+    """Visar strömmade textbitar i en placeholder och returnerar den färdiga texten"""
+    text = ""
+    for delta in stream:
+        text += delta
+        placeholder.markdown(text + "▌")
+    placeholder.markdown(text)
+    return text
+
+def show_blob_image(image, variant=None, **kwargs):
+    """
+    Visar en bild från blob-lagret direkt från disk, i given storleksvariant
+    (se IMAGE_VARIANTS i asset_utils). Andra värden skickas vidare till st.image.
+    """
+    if is_blob_ref(image):
+        if variant:
+            from backend.asset_utils import get_image_variant
+            image = get_image_variant(image, variant) or image
+        path = get_blob_store().path(image)
+        if path is None:
+            st.info("Bilden finns inte längre sparad.")
+            return
+        image = path
+    st.image(image, **kwargs)
 
 def display_chat_history():
     """Visar konversationshistoriken"""
@@ -0,0 +1,34 @@
+# gunicorn.conf.py
+# Läses automatiskt av gunicorn: gunicorn server.proxy:app
+#
+# Huvudprocessen startar och övervakar Streamlit-processerna; gunicorns
+# arbetsprocesser kör proxyn (server/proxy.py) som skickar trafiken vidare.
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "asgi"
+# Proxyn är asynkron, så en process räcker för många samtidiga anslutningar
+workers = int(os.getenv("PROXY_WORKERS", "1"))
+worker_connections = 1000
+# Websocket-anslutningarna lever så länge fliken är öppen
+timeout = 0
+graceful_timeout = 20
+keepalive = 75
+
+_supervisor = None
+
+
+def on_starting(server):
+    global _supervisor
+    from server.supervisor import Supervisor
+
+    _supervisor = Supervisor()
+    _supervisor.start()
+    # Arbetsprocesserna ärver miljön och låter då bli att starta egna Streamlit-processer
+    os.environ["APP_SUPERVISED"] = "1"
+
+
+def on_exit(server):
+    if _supervisor is not None:
+        _supervisor.stop()
@@ -0,0 +1,3 @@
+# server/__init__.py
+# Frontprocessen för driftsättning: startar och övervakar Streamlit-processerna
+# och vidarebefordrar HTTP- och websocket-trafiken till dem
@@ -0,0 +1,362 @@
+# server/proxy.py
+# ASGI-app som tar emot all trafik och vidarebefordrar HTTP och Streamlits
+# websocket-ström till Streamlit-processerna som supervisor.py håller igång.
+#
+# Körs under gunicorn (inställningarna i gunicorn.conf.py läses automatiskt):
+#   gunicorn server.proxy:app
+# eller fristående, då proxyn själv startar Streamlit-processerna:
+#   uvicorn server.proxy:app --port 8000
+
+import os
+import time
+import uuid
+import asyncio
+
+import httpx
+from websockets.asyncio.client import connect as websocket_connect
+from websockets.exceptions import ConnectionClosed
+
+from backend.session_utils import SESSION_COOKIE, valid_session_id
+from server.supervisor import APP_HOST, Supervisor, worker_ports
+
+# Anslutningspool mot Streamlit-processerna, per proxyprocess
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("PROXY_MAX_CONNECTIONS", "100"))
+UPSTREAM_KEEPALIVE = int(os.getenv("PROXY_KEEPALIVE_CONNECTIONS", "20"))
+UPSTREAM_TIMEOUT = float(os.getenv("PROXY_UPSTREAM_TIMEOUT", "60"))
+
+# En process som inte gick att ansluta till hoppas över så här många sekunder
+UNAVAILABLE_COOLDOWN = 2
+
+# Kakan som håller kvar en webbläsare på samma Streamlit-process. Bilder och
+# uppladdade filer finns bara i processen som skapade dem.
+WORKER_COOKIE = "app_worker"
+# Sessionskakan (se backend/session_utils.py) gäller i 30 dagar
+SESSION_COOKIE_MAX_AGE = 30 * 24 * 3600
+
+# Websocket-stängningskoder som bara får rapporteras lokalt, aldrig skickas
+RESERVED_CLOSE_CODES = {1005, 1006, 1015}
+
+# Huvuden som gäller en enskild anslutning och inte ska skickas vidare
+HOP_BY_HOP = {
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailer", b"transfer-encoding", b"upgrade", b"host",
+}
+# Websocket-huvuden som klientbiblioteket sätter själv mot Streamlit
+WEBSOCKET_OWN_HEADERS = {
+    b"sec-websocket-key", b"sec-websocket-version", b"sec-websocket-extensions",
+    b"sec-websocket-protocol", b"origin",
+}
+
+
+class Upstreams:
+    """
+    Streamlit-processerna som proxyn kan skicka trafik till. En webbläsare
+    stannar på sin process (kakan app_worker) så länge den går att nå; nya
+    webbläsare hamnar på processen med minst antal öppna websockets.
+    Hälsokontroll och omstart sköts av Supervisor.
+    """
+
+    def __init__(self, ports):
+        self.ports = ports
+        self._unavailable_until = {}
+        self._active = {port: 0 for port in ports}
+        self._next = 0
+
+    def port_for(self, cookie_value):
+        """Porten som kakans värde pekar ut, eller None"""
+        if cookie_value and cookie_value.isdigit() and int(cookie_value) < len(self.ports):
+            return self.ports[int(cookie_value)]
+        return None
+
+    def cookie_value(self, port):
+        return str(self.ports.index(port))
+
+    def candidates(self, preferred=None):
+        """
+        Portarna i den ordning de ska provas: den klistrade, sedan de minst
+        belastade och sist de som nyligen inte gick att nå
+        """
+        now = time.monotonic()
+        # Lika belastade processer turas om
+        self._next = (self._next + 1) % len(self.ports)
+        rotated = self.ports[self._next:] + self.ports[:self._next]
+        available = sorted(
+            (p for p in rotated if self._unavailable_until.get(p, 0) <= now),
+            key=lambda p: self._active[p],
+        )
+        if preferred in available:
+            available.remove(preferred)
+            available.insert(0, preferred)
+        return available + [p for p in rotated if p not in available]
+
+    def mark_unavailable(self, port):
+        self._unavailable_until[port] = time.monotonic() + UNAVAILABLE_COOLDOWN
+
+    def mark_available(self, port):
+        self._unavailable_until.pop(port, None)
+
+    def opened(self, port):
+        self._active[port] += 1
+
+    def closed(self, port):
+        self._active[port] -= 1
+
+
+def _parse_cookies(headers):
+    cookies = {}
+    for name, value in headers:
+        if name.lower() == b"cookie":
+            for part in value.decode("latin-1").split(";"):
+                key, sep, val = part.strip().partition("=")
+                if sep:
+                    cookies.setdefault(key, val)
+    return cookies
+
+
+def _scheme(scope):
+    """Protokollet som webbläsaren använde, även bakom Renders TLS-terminering"""
+    forwarded = dict(scope["headers"]).get(b"x-forwarded-proto")
+    if forwarded:
+        return forwarded.decode("latin-1").split(",")[0].strip()
+    scheme = scope.get("scheme", "http")
+    return {"ws": "http", "wss": "https"}.get(scheme, scheme)
+
+
+def _set_cookie(scope, name, value, max_age=None):
+    attributes = [f"{name}={value}", "Path=/", "HttpOnly", "SameSite=Lax"]
+    if max_age:
+        attributes.append(f"Max-Age={max_age}")
+    if _scheme(scope) == "https":
+        attributes.append("Secure")
+    return (b"set-cookie", "; ".join(attributes).encode("latin-1"))
+
+
+def _forwarded_headers(scope, skip, extra_cookie=None):
+    """Klientens huvuden utan anslutningsspecifika, plus X-Forwarded-*"""
+    skip = skip | {b"x-forwarded-for", b"x-forwarded-host", b"x-forwarded-proto"}
+    headers = [(k, v) for k, v in scope["headers"] if k.lower() not in skip]
+    original = dict(scope["headers"])
+    client = scope.get("client")
+    if client:
+        previous = original.get(b"x-forwarded-for")
+        address = client[0].encode("latin-1")
+        headers.append((b"x-forwarded-for", previous + b", " + address if previous else address))
+    host = original.get(b"x-forwarded-host") or original.get(b"host")
+    if host:
+        headers.append((b"x-forwarded-host", host))
+    headers.append((b"x-forwarded-proto", _scheme(scope).encode("latin-1")))
+    # En ny sessionskaka följer med redan i den första förfrågan
+    if extra_cookie:
+        values = [v for k, v in headers if k.lower() == b"cookie"] + [extra_cookie.encode("latin-1")]
+        headers = [(k, v) for k, v in headers if k.lower() != b"cookie"]
+        headers.append((b"cookie", b"; ".join(values)))
+    return headers
+
+
+def _target(scope):
+    path = scope.get("raw_path") or scope["path"].encode("utf-8")
+    query = scope.get("query_string") or b""
+    return path.decode("latin-1") + ("?" + query.decode("latin-1") if query else "")
+
+
+class StreamlitProxy:
+    """ASGI-app: vidarebefordrar HTTP via en anslutningspool och websockets via en tunnel"""
+
+    def __init__(self, ports=None):
+        self.upstreams = Upstreams(ports or worker_ports())
+        self.client = None
+        self.supervisor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self.handle_http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self.handle_websocket(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self.handle_lifespan(receive, send)
+
+    async def handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Under gunicorn startas Streamlit-processerna av huvudprocessen
+                # (gunicorn.conf.py); fristående startar proxyn dem själv
+                if not os.environ.get("APP_SUPERVISED"):
+                    self.supervisor = Supervisor(len(self.upstreams.ports), self.upstreams.ports[0])
+                    await asyncio.to_thread(self.supervisor.start)
+                self.client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=2),
+                    limits=httpx.Limits(
+                        max_connections=UPSTREAM_MAX_CONNECTIONS,
+                        max_keepalive_connections=UPSTREAM_KEEPALIVE,
+                    ),
+                    follow_redirects=False,
+                )
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.client is not None:
+                    await self.client.aclose()
+                if self.supervisor is not None:
+                    await asyncio.to_thread(self.supervisor.stop)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _route(self, scope):
+        """
+        Läser kakorna och väljer processer att prova.
+
+        Returns:
+            tuple: (kandidatportar, sessions-id, True om sessions-id:t är nytt, kakor)
+        """
+        cookies = _parse_cookies(scope["headers"])
+        session_id = cookies.get(SESSION_COOKIE)
+        new_session = not valid_session_id(session_id)
+        if new_session:
+            session_id = uuid.uuid4().hex
+        preferred = self.upstreams.port_for(cookies.get(WORKER_COOKIE))
+        return self.upstreams.candidates(preferred), session_id, new_session, cookies
+
+    def _cookie_headers(self, scope, port, session_id, new_session, cookies):
+        """Set-Cookie för sessionen och processen, när de saknas eller har ändrats"""
+        headers = []
+        if new_session:
+            headers.append(_set_cookie(scope, SESSION_COOKIE, session_id, SESSION_COOKIE_MAX_AGE))
+        worker = self.upstreams.cookie_value(port)
+        if cookies.get(WORKER_COOKIE) != worker:
+            headers.append(_set_cookie(scope, WORKER_COOKIE, worker))
+        return headers
+
+    async def _read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def handle_http(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        candidates, session_id, new_session, cookies = self._route(scope)
+        headers = _forwarded_headers(
+            scope, HOP_BY_HOP, f"{SESSION_COOKIE}={session_id}" if new_session else None,
+        )
+        for port in candidates:
+            request = self.client.build_request(
+                scope["method"], f"http://{APP_HOST}:{port}{_target(scope)}", headers=headers, content=body,
+            )
+            try:
+                response = await self.client.send(request, stream=True)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                self.upstreams.mark_unavailable(port)
+                continue
+            self.upstreams.mark_available(port)
+            try:
+                await send({
+                    "type": "http.response.start",
+                    "status": response.status_code,
+                    "headers": [(k, v) for k, v in response.headers.raw if k.lower() not in HOP_BY_HOP]
+                    + self._cookie_headers(scope, port, session_id, new_session, cookies),
+                })
+                # Råa bytes: svaret skickas vidare komprimerat som Streamlit skickade det
+                async for chunk in response.aiter_raw():
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+            finally:
+                await response.aclose()
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": 502,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"retry-after", b"5")],
+        })
+        await send({"type": "http.response.body", "body": "Appen startar, försök igen om en liten stund.".encode("utf-8")})
+
+    async def handle_websocket(self, scope, receive, send):
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        candidates, session_id, new_session, cookies = self._route(scope)
+        # websockets-klienten vill ha huvudena som text
+        headers = [
+            (k.decode("latin-1"), v.decode("latin-1"))
+            for k, v in _forwarded_headers(
+                scope, HOP_BY_HOP | WEBSOCKET_OWN_HEADERS, f"{SESSION_COOKIE}={session_id}" if new_session else None,
+            )
+        ]
+        origin = dict(scope["headers"]).get(b"origin")
+
+        upstream = None
+        for port in candidates:
+            try:
+                upstream = await websocket_connect(
+                    f"ws://{APP_HOST}:{port}{_target(scope)}",
+                    additional_headers=headers,
+                    subprotocols=scope.get("subprotocols") or None,
+                    origin=origin.decode("latin-1") if origin else None,
+                    # Lokalt lönar sig varken komprimering eller keepalive-ping
+                    compression=None,
+                    ping_interval=None,
+                    max_size=None,
+                    open_timeout=5,
+                )
+            except (OSError, asyncio.TimeoutError):
+                self.upstreams.mark_unavailable(port)
+                continue
+            self.upstreams.mark_available(port)
+            break
+        if upstream is None:
+            # 1013: försök igen senare; Streamlits klient återansluter själv
+            await send({"type": "websocket.close", "code": 1013})
+            return
+
+        # Har webbläsaren flyttats till en annan process följer kakan med
+        await send({
+            "type": "websocket.accept",
+            "subprotocol": upstream.subprotocol,
+            "headers": self._cookie_headers(scope, port, session_id, new_session, cookies),
+        })
+
+        async def client_to_upstream():
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes") is not None:
+                    await upstream.send(message["bytes"])
+                elif message.get("text") is not None:
+                    await upstream.send(message["text"])
+
+        async def upstream_to_client():
+            try:
+                async for data in upstream:
+                    if isinstance(data, bytes):
+                        await send({"type": "websocket.send", "bytes": data})
+                    else:
+                        await send({"type": "websocket.send", "text": data})
+            except ConnectionClosed:
+                pass
+            # Streamlit-processen stängde (t.ex. vid omstart); klienten återansluter.
+            # Dog processen finns ingen riktig stängningskod, och de reserverade
+            # koderna får inte skickas i en stängningsram; 1012 betyder omstart
+            code = upstream.close_code
+            if code is None or code in RESERVED_CLOSE_CODES:
+                code = 1012
+            await send({"type": "websocket.close", "code": code})
+
+        self.upstreams.opened(port)
+        tasks = [asyncio.ensure_future(client_to_upstream()), asyncio.ensure_future(upstream_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.upstreams.closed(port)
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+
+
+app = StreamlitProxy()
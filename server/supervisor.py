@@ -0,0 +1,182 @@
+# server/supervisor.py
+# Startar en eller flera Streamlit-processer, hälsokontrollerar dem och
+# startar om dem som dör eller slutar svara.
+
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+import http.client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Antal Streamlit-processer ("auto" ger en per kärna) och första porten;
+# process i lyssnar på APP_BASE_PORT + i
+_app_workers = os.getenv("APP_WORKERS", "1")
+APP_WORKERS = (os.cpu_count() or 1) if _app_workers == "auto" else int(_app_workers)
+APP_BASE_PORT = int(os.getenv("APP_BASE_PORT", "8600"))
+APP_HOST = "127.0.0.1"
+
+# Hälsokontroll: intervall i sekunder och antal missade svar i rad innan omstart.
+# En nystartad process får APP_START_GRACE sekunder på sig innan missar räknas.
+APP_HEALTH_INTERVAL = float(os.getenv("APP_HEALTH_INTERVAL", "5"))
+APP_HEALTH_FAILURES = int(os.getenv("APP_HEALTH_FAILURES", "3"))
+APP_START_GRACE = float(os.getenv("APP_START_GRACE", "60"))
+
+# Längsta väntan mellan omstarter av en process som kraschar direkt
+MAX_RESTART_BACKOFF = 30
+
+
+def worker_ports(count=APP_WORKERS, base_port=APP_BASE_PORT):
+    """Portarna som Streamlit-processerna lyssnar på"""
+    return [base_port + i for i in range(count)]
+
+
+def check_health(port, timeout=2):
+    """True om Streamlit-processen på porten svarar på /_stcore/health"""
+    connection = http.client.HTTPConnection(APP_HOST, port, timeout=timeout)
+    try:
+        connection.request("GET", "/_stcore/health")
+        return connection.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        connection.close()
+
+
+class StreamlitWorker:
+    """En Streamlit-process på en given port"""
+
+    def __init__(self, index, port, app_path="app.py"):
+        self.index = index
+        self.port = port
+        self.app_path = app_path
+        self.process = None
+        self.started_at = None
+        self.failures = 0
+        self.restarts = 0
+        self.backoff = 1
+        self.retry_at = None
+
+    def command(self):
+        return [
+            sys.executable, "-m", "streamlit", "run", self.app_path,
+            "--server.port", str(self.port),
+            "--server.address", APP_HOST,
+            "--server.headless", "true",
+            # CORS- och XSRF-skyddet är avstängt precis som i den tidigare Procfile.
+            # Proxyn gör inga egna Origin- eller XSRF-kontroller; processen lyssnar
+            # bara på 127.0.0.1 och nås därför endast via proxyn
+            "--server.enableCORS", "false",
+            "--server.enableXsrfProtection", "false",
+            "--browser.gatherUsageStats", "false",
+        ]
+
+    def environment(self):
+        env = dict(os.environ)
+        env["APP_WORKER_INDEX"] = str(self.index)
+        # Varje process får en egen /metrics-port så att de inte krockar
+        metrics_port = int(env.get("TELEMETRY_METRICS_PORT", "9464"))
+        if metrics_port:
+            env["TELEMETRY_METRICS_PORT"] = str(metrics_port + self.index)
+        return env
+
+    def start(self):
+        # Utdata går direkt till frontprocessens loggar; en PIPE som ingen läser
+        # fylls och får till slut processen att hänga
+        self.process = subprocess.Popen(self.command(), cwd=ROOT, env=self.environment())
+        self.started_at = time.monotonic()
+        self.failures = 0
+        print(f"Startade Streamlit-process {self.index} på port {self.port} (pid {self.process.pid})")
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def in_grace_period(self):
+        return self.started_at is not None and time.monotonic() - self.started_at < APP_START_GRACE
+
+    def stop(self, timeout=10):
+        """Avslutar processen, först snällt och sedan med SIGKILL"""
+        if not self.is_running():
+            return
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def restart(self, reason):
+        print(f"Startar om Streamlit-process {self.index} på port {self.port}: {reason}")
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def status(self):
+        return {
+            "index": self.index,
+            "port": self.port,
+            "pid": self.process.pid if self.process else None,
+            "running": self.is_running(),
+            "failures": self.failures,
+            "restarts": self.restarts,
+        }
+
+
+class Supervisor:
+    """
+    Håller APP_WORKERS Streamlit-processer igång. En tråd kontrollerar dem
+    med jämna mellanrum och startar om processer som har avslutats eller
+    inte svarat på hälsokontrollen APP_HEALTH_FAILURES gånger i rad.
+    """
+
+    def __init__(self, count=APP_WORKERS, base_port=APP_BASE_PORT, app_path="app.py"):
+        self.workers = [StreamlitWorker(i, port, app_path) for i, port in enumerate(worker_ports(count, base_port))]
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self._thread = threading.Thread(target=self._watch, name="streamlit-supervisor", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        while not self._stop.wait(APP_HEALTH_INTERVAL):
+            for worker in self.workers:
+                try:
+                    self._check(worker)
+                except Exception as e:
+                    print(f"Kunde inte kontrollera Streamlit-process {worker.index}: {e}")
+
+    def _check(self, worker):
+        if not worker.is_running():
+            now = time.monotonic()
+            if worker.retry_at is None:
+                # Kraschar processen direkt efter start väntar vi allt längre mellan försöken
+                worker.backoff = min(worker.backoff * 2, MAX_RESTART_BACKOFF) if worker.in_grace_period() else 1
+                worker.retry_at = now + worker.backoff
+            if now >= worker.retry_at:
+                worker.retry_at = None
+                worker.restart("processen har avslutats")
+            return
+        if check_health(worker.port):
+            worker.failures = 0
+            return
+        if worker.in_grace_period():
+            return
+        worker.failures += 1
+        if worker.failures >= APP_HEALTH_FAILURES:
+            worker.restart(f"svarade inte på {worker.failures} hälsokontroller i rad")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=APP_HEALTH_INTERVAL + 1)
+        for worker in self.workers:
+            worker.stop()
+
+    def status(self):
+        return [worker.status() for worker in self.workers]